@@ -0,0 +1,34 @@
+import os
+
+from tools.sql_tool import sql_tool_result, sql_tool_aresult
+from tools.travel_tool import travel_tool_func, travel_tool_afunc
+
+'''
+ Deterministic fast path: for intents listed in DIRECT_INTENTS the routed
+ query goes straight to the tool pipeline and its output is returned as is,
+ skipping the wrapper agent's "call the tool" and "echo the output" LLM hops.
+ '''
+DIRECT_TOOLS = {
+    # SQL returns its structured dict, skipping a JSON encode/decode round trip.
+    "sql": (sql_tool_result, sql_tool_aresult),
+    "travel": (travel_tool_func, travel_tool_afunc),
+}
+
+DIRECT_INTENTS = {
+    i.strip() for i in os.getenv("DIRECT_INTENTS", "sql").split(",")
+    if i.strip() in DIRECT_TOOLS
+}
+
+
+def is_direct(intent: str) -> bool:
+    return intent in DIRECT_INTENTS
+
+
+def run_direct(intent: str, query: str):
+    func, _ = DIRECT_TOOLS[intent]
+    return func(query)
+
+
+async def arun_direct(intent: str, query: str):
+    _, coroutine = DIRECT_TOOLS[intent]
+    return await coroutine(query)
@@ -0,0 +1,131 @@
+import argparse
+import json
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from utils.clean_text import stem
+
+'''
+ Local intent classifier: TF-IDF features (stemmed words, word bigrams and
+ character trigrams) and one L2-normalized centroid per intent. Scoring a
+ query is a handful of dict lookups and one small matrix product, well
+ under a millisecond on CPU, with no network call.
+
+ The model is trained from labeled queries ({"query": ..., "intent": ...}
+ per line): the examples shipped in agents/intent_examples.jsonl, plus an
+ optional log of real, labeled traffic. It can be trained ahead of time
+ and saved with
+
+     python -m agents.intent_classifier --log labeled.jsonl --out cache/intent_model.npz
+
+ and is otherwise trained at startup, which takes milliseconds.
+ '''
+WORD_RE = re.compile(r"[a-z0-9]+")
+EXAMPLES_PATH = os.path.join(os.path.dirname(__file__), "intent_examples.jsonl")
+# Softmax temperature over cosine similarities; lower = more decisive.
+TEMPERATURE = 0.05
+
+
+def features(text: str) -> list:
+    words = [stem(w) for w in WORD_RE.findall(text.lower())]
+    feats = [f"w:{w}" for w in words]
+    feats += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"#{w}#"
+        feats += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return feats
+
+
+def load_examples(path: str) -> list:
+    with open(path, encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    # Queries with no features (e.g. "???", emoji only) can't be learned from.
+    return [(r["query"], r["intent"]) for r in rows
+            if r.get("query") and r.get("intent") and features(r["query"])]
+
+
+class IntentClassifier:
+    def __init__(self, vocab, idf, centroids, labels):
+        self.vocab = vocab
+        self.idf = idf
+        self.centroids = centroids
+        self.labels = labels
+
+    @classmethod
+    def train(cls, examples):
+        """Fit on (query, intent) pairs."""
+        examples = [(q, intent) for q, intent in examples if features(q)]
+        docs = [Counter(features(q)) for q, _ in examples]
+        df = Counter(f for doc in docs for f in doc)
+        vocab = {f: i for i, f in enumerate(sorted(df))}
+        n = len(docs)
+        idf = np.array([np.log((1 + n) / (1 + df[f])) + 1 for f in sorted(df)], dtype=np.float32)
+
+        labels = sorted({intent for _, intent in examples})
+        centroids = np.zeros((len(labels), len(vocab)), dtype=np.float32)
+        for doc, (_, intent) in zip(docs, examples):
+            idx = np.array([vocab[f] for f in doc], dtype=np.intp)
+            weights = np.array(list(doc.values()), dtype=np.float32) * idf[idx]
+            norm = np.linalg.norm(weights)
+            if norm:
+                centroids[labels.index(intent), idx] += weights / norm
+        norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+        centroids /= np.where(norms == 0, 1, norms)
+        return cls(vocab, idf, centroids, labels)
+
+    def scores(self, query: str) -> dict:
+        """Probability per intent (softmax over cosine similarity to each centroid)."""
+        counts = Counter(f for f in features(query) if f in self.vocab)
+        if not counts:
+            return {label: 1 / len(self.labels) for label in self.labels}
+        idx = np.array([self.vocab[f] for f in counts], dtype=np.intp)
+        weights = np.array(list(counts.values()), dtype=np.float32) * self.idf[idx]
+        sims = self.centroids[:, idx] @ (weights / np.linalg.norm(weights))
+        exp = np.exp((sims - sims.max()) / TEMPERATURE)
+        probs = exp / exp.sum()
+        return dict(zip(self.labels, probs.tolist()))
+
+    def predict(self, query: str):
+        """Return (intent, confidence)."""
+        scores = self.scores(query)
+        intent = max(scores, key=scores.get)
+        return intent, scores[intent]
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        features_ = np.array(sorted(self.vocab, key=self.vocab.get))
+        np.savez_compressed(path, features=features_, idf=self.idf,
+                            centroids=self.centroids, labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path: str):
+        data = np.load(path)
+        vocab = {f: i for i, f in enumerate(data["features"].tolist())}
+        return cls(vocab, data["idf"], data["centroids"], data["labels"].tolist())
+
+
+def load_classifier(model_path=None, log_path=None) -> IntentClassifier:
+    """Load a saved model if there is one, else train on the examples (+ log)."""
+    if model_path and os.path.exists(model_path):
+        return IntentClassifier.load(model_path)
+    examples = load_examples(EXAMPLES_PATH)
+    if log_path and os.path.exists(log_path):
+        examples += load_examples(log_path)
+    return IntentClassifier.train(examples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train the intent classifier.")
+    parser.add_argument("--log", action="append", default=[], help="labeled query log (JSONL), repeatable")
+    parser.add_argument("--out", default="cache/intent_model.npz")
+    args = parser.parse_args()
+
+    examples = load_examples(EXAMPLES_PATH)
+    for path in args.log:
+        examples += load_examples(path)
+    model = IntentClassifier.train(examples)
+    model.save(args.out)
+    print(f"Trained on {len(examples)} examples ({Counter(i for _, i in examples)}) -> {args.out}")
@@ -1,9 +1,10 @@
 from langchain.agents import create_agent
 from tools.internet_tool import internet_tool
 
-def create_internet_agent(llm):
+def create_internet_agent(llm, middleware=()):
     return create_agent(
         model=llm,
+        middleware=list(middleware),
         tools=[internet_tool],
         system_prompt="Answer ONLY using InternetSearch."
     )
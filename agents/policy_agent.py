@@ -1,9 +1,10 @@
 from langchain.agents import create_agent
 from tools.policy_tool import policy_tool
 
-def create_policy_agent(llm):
+def create_policy_agent(llm, middleware=()):
     return create_agent(
         model=llm,
+        middleware=list(middleware),
         tools=[policy_tool],
         system_prompt="Answer ONLY using PolicySearch."
     )
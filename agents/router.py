@@ -1,4 +1,26 @@
-def detect_intent(query: str) -> str:
+import os
+from collections import Counter
+
+from agents.intent_classifier import load_classifier
+
+'''
+ Routes a query to an agent key. The local classifier (agents/intent_classifier.py)
+ decides when it is confident; ambiguous queries, scored below
+ INTENT_MIN_CONFIDENCE, fall back to the keyword rules. INTENT_ROUTER=keyword
+ uses the rules only.
+ '''
+ROUTER = os.getenv("INTENT_ROUTER", "model")
+MIN_CONFIDENCE = float(os.getenv("INTENT_MIN_CONFIDENCE", "0.45"))
+
+classifier = load_classifier(
+    model_path=os.getenv("INTENT_MODEL_PATH", "cache/intent_model.npz"),
+    log_path=os.getenv("INTENT_TRAINING_LOG")
+) if ROUTER == "model" else None
+
+routed = Counter()
+
+
+def keyword_intent(query: str) -> str:
     q = query.lower()
 
     if any(k in q for k in [
@@ -21,3 +43,17 @@ def detect_intent(query: str) -> str:
         return "travel"
 
     return "internet"
+
+
+def detect_intent(query: str) -> str:
+    if classifier is not None:
+        intent, confidence = classifier.predict(query)
+        if confidence >= MIN_CONFIDENCE:
+            routed["model"] += 1
+            return intent
+    routed["keyword"] += 1
+    return keyword_intent(query)
+
+
+def stats():
+    return dict(routed)
@@ -1,16 +1,18 @@
 from langchain.agents import create_agent
-from tools.sql_tool import sql_tool_func
+from tools.sql_tool import sql_tool_func, sql_tool_afunc
 from langchain_core.tools import Tool
 
 sql_tool = Tool(
     name="SQLSearch",
     func=sql_tool_func,
+    coroutine=sql_tool_afunc,
     description="SQL database queries + graph generation"
 )
 
-def create_sql_agent(llm):
+def create_sql_agent(llm, middleware=()):
     return create_agent(
         model=llm,
+        middleware=list(middleware),
         tools=[sql_tool],
         system_prompt="""
 You are a SQL execution agent.
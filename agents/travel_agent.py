@@ -2,9 +2,10 @@ from langchain.agents import create_agent
 from tools.travel_tool import travel_tool
 
 
-def create_travel_agent(llm):
+def create_travel_agent(llm, middleware=()):
     return create_agent(
         model=llm,
+        middleware=list(middleware),
         tools=[travel_tool],
         system_prompt="""
 You are a travel planning agent.
@@ -1,28 +1,38 @@
-import os, json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, send_from_directory
-from langchain_openai import AzureChatOpenAI
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 
 load_dotenv()
-from memory import get_memory
+from memory import get_memory, memory_store
+from agents import router
 from agents.router import detect_intent
 from agents.sql_agent import create_sql_agent
 from agents.policy_agent import create_policy_agent
 from agents.internet_agent import create_internet_agent
 from agents.travel_agent import create_travel_agent
+from agents.direct import is_direct, run_direct
+from utils.payload import build_payload, build_messages, sse, table_format_of
+from utils.fastjson import dumps
+from utils.compression import compress
+from utils.compaction import HistoryCompactor, llm_summarizer
+from utils.answer_cache import answer_cache
+from utils import batch, singleflight
+from utils.llm_scheduler import BATCH, llm_scheduler, set_priority
+from utils.metrics import render_metrics
+from utils.tracing import current_trace, observe_payload, observe_request, set_intent, span, start_trace, wants_timing
+from tools.policy_tool import policy_fanout, policy_index
+from tools.sql_tool import catalog, plan_cache, result_cache, sql_page
+from tools.web_search import web_search
+from utils.clients import get_llm
+from warmup import warmup_backends
 
 app = Flask(__name__)
 
-CORS(app, resources={r"/ask": {"origins": "*"}})
+CORS(app, resources={r"/ask*": {"origins": "*"}})
 
-llm = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-    api_version="2024-02-01",
-    temperature=0
-)
+llm = get_llm()
 
 agents = {
     "sql": create_sql_agent(llm),
@@ -31,45 +41,239 @@ agents = {
     "travel": create_travel_agent(llm)
 }
 
+compactor = HistoryCompactor(llm_summarizer(llm))
+
+
+def json_response(payload, status=200):
+    return Response(dumps(payload), status=status, mimetype="application/json")
+
+
+@app.after_request
+def compress_response(response):
+    if response.is_streamed or response.mimetype != "application/json" or "Content-Encoding" in response.headers:
+        return response
+    body, encoding = compress(response.get_data(), request.headers.get("Accept-Encoding", ""))
+    response.vary.add("Accept-Encoding")
+    if encoding:
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@app.before_request
+def begin_trace():
+    start_trace()
+
+
+@app.after_request
+def finish_trace(response):
+    # Streamed responses are observed when their generator finishes.
+    trace = current_trace()
+    if trace is None or response.is_streamed:
+        return response
+    observe_request(request.url_rule.rule if request.url_rule else "unmatched", trace)
+    if response.mimetype == "application/json":
+        observe_payload("response", response.content_length or 0)
+    if wants_timing(request.headers):
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+def route(query, cid):
+    with span("memory"):
+        memory = get_memory(cid)
+    with span("route"):
+        intent = detect_intent(query)
+    set_intent(intent)
+    return memory, intent
+
+
+def answer_for(query, memory, intent):
+    with span("answer_cache", "cache"):
+        answer = answer_cache.get(intent, query, memory)
+    if answer is None:
+        if is_direct(intent):
+            with span("direct_tool"):
+                answer = run_direct(intent, query)
+        else:
+            agent = agents[intent]
+            with span("compaction"):
+                history = compactor.messages_for(memory, intent)
+            with span("agent"):
+                result = agent.invoke({
+                    "messages": build_messages(history, query)
+                })
+            answer = result["messages"][-1].content
+        answer_cache.put(intent, query, answer, memory)
+    return answer
+
+
 @app.route("/ask", methods=["POST"])
 def ask():
     data = request.get_json()
     query = data["query"]
     cid = data["conversation_id"]
 
-    memory = get_memory(cid)
-    intent = detect_intent(query)
+    memory, intent = route(query, cid)
+
+    answer = answer_for(query, memory, intent)
+
+    payload, is_text = build_payload(answer, table_format_of(data))
+
+    if is_text:
+        memory.add_user_message(query)
+        memory.add_ai_message(answer)
+
+    return json_response(payload)
+
+
+@app.route("/ask/stream", methods=["POST"])
+def ask_stream():
+    data = request.get_json()
+    query = data["query"]
+    cid = data["conversation_id"]
 
+    memory, intent = route(query, cid)
     agent = agents[intent]
-    result = agent.invoke({
-        "messages": memory.messages + [{"role": "user", "content": query}]
-    })
+    trace = current_trace()
+
+    def generate():
+        try:
+            with span("answer_cache", "cache"):
+                answer = answer_cache.get(intent, query, memory)
+            if answer is None:
+                if is_direct(intent):
+                    with span("direct_tool"):
+                        answer = run_direct(intent, query)
+                else:
+                    with span("compaction"):
+                        history = compactor.messages_for(memory, intent)
+                    final = None
+                    for mode, chunk in agent.stream(
+                        {"messages": build_messages(history, query)},
+                        stream_mode=["messages", "values"]
+                    ):
+                        # "messages" mode yields LLM token chunks as they arrive,
+                        # "values" mode yields the full graph state after each step.
+                        if mode == "messages":
+                            token, meta = chunk
+                            if meta.get("langgraph_node") == "model" and token.content:
+                                yield sse("token", {"text": token.content})
+                        else:
+                            final = chunk
+                    answer = final["messages"][-1].content if final else ""
+                answer_cache.put(intent, query, answer, memory)
+        except Exception as e:
+            observe_request("/ask/stream", trace)
+            yield sse("error", {"error": str(e)})
+            return
+
+        payload, is_text = build_payload(answer, table_format_of(data))
+
+        if is_text:
+            memory.add_user_message(query)
+            memory.add_ai_message(answer)
+
+        observe_request("/ask/stream", trace)
+        yield sse("done", payload)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.route("/ask/batch", methods=["POST"])
+def ask_batch():
+    data = request.get_json()
+    items = data.get("items") or []
+    if len(items) > batch.MAX_ITEMS:
+        return json_response({"error": f"At most {batch.MAX_ITEMS} items per batch"}, 400)
+    table_format = table_format_of(data)
+    # Direct tools answer from the question alone, so their conversations aren't loaded.
+    jobs, invalid = batch.plan_batch(items, detect_intent, get_memory, lambda intent: not is_direct(intent))
+    trace = current_trace()
+
+    def run(job):
+        # Each job gets its own trace so stage metrics carry its intent.
+        start_trace()
+        set_intent(job.intent)
+        # Interactive /ask calls are admitted to the LLM ahead of batch work.
+        set_priority(BATCH)
+        try:
+            return answer_for(job.query, job.memory, job.intent), None
+        except Exception as e:
+            return None, str(e)
+
+    def generate():
+        for i in invalid:
+            yield batch.batch_line(i, items[i], error="Each item needs a query and a conversation_id")
+
+        pools = {intent: ThreadPoolExecutor(max_workers=batch.concurrency(intent))
+                 for intent in {job.intent for job in jobs}}
+        try:
+            futures = {pools[job.intent].submit(run, job): job for job in jobs}
+            # Lines go out in completion order; "index" ties them to the request.
+            for future in as_completed(futures):
+                job = futures[future]
+                answer, error = future.result()
+                if error is not None:
+                    for i in job.indexes:
+                        yield batch.batch_line(i, items[i], job.intent, error=error)
+                    continue
+                payload, is_text = build_payload(answer, table_format)
+                for i in job.indexes:
+                    if is_text:
+                        memory = get_memory(items[i]["conversation_id"])
+                        memory.add_user_message(items[i]["query"])
+                        memory.add_ai_message(answer)
+                    yield batch.batch_line(i, items[i], job.intent, payload)
+        finally:
+            for pool in pools.values():
+                pool.shutdown(wait=False, cancel_futures=True)
+            observe_request("/ask/batch", trace)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
 
-    answer = result["messages"][-1].content
 
-    # ---- GRAPH / TABLE PASS-THROUGH ----
+@app.route("/ask/page", methods=["POST"])
+def ask_page():
+    data = request.get_json()
     try:
-        parsed = json.loads(answer)
-    except Exception:
-        parsed = None
+        page = sql_page(data["token"])
+    except (KeyError, ValueError) as e:
+        return json_response({"error": f"Invalid page token: {e}"}, 400)
+    payload, _ = build_payload(page, table_format_of(data))
+    return json_response(payload)
+
+
+@app.route("/stats")
+def stats():
+    return jsonify({
+        "memory": memory_store.stats(),
+        "sql_plan_cache": plan_cache.stats(),
+        "sql_result_cache": result_cache.stats(),
+        "sql_schema": catalog.stats(),
+        "policy_index": policy_index.stats() if policy_index is not None else None,
+        "policy_fanout": policy_fanout.stats(),
+        "web_search": web_search.stats(),
+        "history_compaction": compactor.stats(),
+        "answer_cache": answer_cache.stats(),
+        "coalescing": singleflight.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "intent_router": router.stats()
+    })
+
 
-    if parsed and parsed.get("type") == "image":
-        return jsonify({
-            "type": "image",
-            "image": parsed["data"],
-            "answer": "Here is the graph."
-        })
+@app.route("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
 
-    if parsed and parsed.get("type") == "sql_result":
-        return jsonify({
-            "type": "table",
-            "data": parsed["data"]
-        })
 
-    memory.add_user_message(query)
-    memory.add_ai_message(answer)
+@app.route("/warmup", methods=["POST"])
+def warmup():
+    return jsonify(warmup_backends())
 
-    return jsonify({"answer": answer})
 
 @app.route('/')
 def index():
@@ -81,4 +285,5 @@ def index_html():
     return send_from_directory('.', 'index.html')
 
 if __name__ == "__main__":
-    app.run(port=5500, debug=True)
+    # Development server only; see README "Production serving".
+    app.run(port=5500, debug=os.getenv("FLASK_DEBUG") == "1")
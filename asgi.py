@@ -0,0 +1,306 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+load_dotenv()
+from memory import get_memory, memory_store
+from agents import router
+from agents.router import detect_intent
+from agents.sql_agent import create_sql_agent
+from agents.policy_agent import create_policy_agent
+from agents.internet_agent import create_internet_agent
+from agents.travel_agent import create_travel_agent
+from agents.direct import is_direct, arun_direct
+from utils.limits import LLMLimitMiddleware, run_limited
+from utils.payload import build_payload, build_messages, sse, table_format_of
+from utils.fastjson import dumps
+from utils.compression import compress
+from utils.compaction import HistoryCompactor, llm_summarizer
+from utils.answer_cache import answer_cache
+from utils import batch, singleflight
+from utils.llm_scheduler import BATCH, llm_scheduler, set_priority
+from utils.metrics import render_metrics
+from utils.tracing import observe_payload, observe_request, set_intent, span, start_trace, wants_timing
+from tools.policy_tool import policy_fanout, policy_index
+from tools.sql_tool import catalog, plan_cache, result_cache, sql_page
+from tools.web_search import web_search
+from utils.clients import get_llm
+from warmup import warmup_backends
+
+# Async serving path: same API as app.py, but every request is a coroutine
+# instead of a thread, so one process can hold many in-flight conversations.
+# Run with: uvicorn asgi:app --host 0.0.0.0 --port 5500 --workers 4
+
+llm = get_llm()
+
+middleware = [LLMLimitMiddleware()]
+
+agents = {
+    "sql": create_sql_agent(llm, middleware),
+    "policy": create_policy_agent(llm, middleware),
+    "internet": create_internet_agent(llm, middleware),
+    "travel": create_travel_agent(llm, middleware)
+}
+
+compactor = HistoryCompactor(llm_summarizer(llm))
+
+
+def json_response(request, payload, status_code=200):
+    body, encoding = compress(dumps(payload), request.headers.get("accept-encoding", ""))
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+class TracingMiddleware:
+    """Starts a trace per request, observes its latency and adds Server-Timing."""
+
+    STREAMED = ("text/event-stream", "application/x-ndjson")
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        trace = start_trace()
+        timing = wants_timing(Headers(scope=scope))
+        sent = {"bytes": 0, "json": False}
+
+        async def send_traced(message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                content_type = headers.get("content-type", "")
+                sent["json"] = content_type.startswith("application/json")
+                # Streamed bodies are still being produced; their timing is incomplete.
+                if timing and not content_type.startswith(self.STREAMED):
+                    headers["Server-Timing"] = trace.server_timing()
+            elif message["type"] == "http.response.body":
+                sent["bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_traced)
+        finally:
+            observe_request(scope["path"] if "endpoint" in scope else "unmatched", trace)
+            if sent["json"]:
+                observe_payload("response", sent["bytes"])
+
+
+def route(query, cid):
+    # Blocking with MEMORY_BACKEND=sqlite; handlers run it in a thread.
+    with span("memory"):
+        memory = get_memory(cid)
+    with span("route"):
+        intent = detect_intent(query)
+    set_intent(intent)
+    return memory, intent
+
+
+async def answer_for(query, memory, intent):
+    with span("answer_cache", "cache"):
+        answer = await asyncio.to_thread(answer_cache.get, intent, query, memory)
+    if answer is None:
+        if is_direct(intent):
+            with span("direct_tool"):
+                answer = await arun_direct(intent, query)
+        else:
+            agent = agents[intent]
+            with span("compaction"):
+                history = await run_limited("llm", compactor.messages_for, memory, intent)
+            with span("agent"):
+                result = await agent.ainvoke({
+                    "messages": build_messages(history, query)
+                })
+            answer = result["messages"][-1].content
+        await asyncio.to_thread(answer_cache.put, intent, query, answer, memory)
+    return answer
+
+
+async def ask(request):
+    data = await request.json()
+    query = data["query"]
+    cid = data["conversation_id"]
+
+    memory, intent = await asyncio.to_thread(route, query, cid)
+
+    answer = await answer_for(query, memory, intent)
+
+    payload, is_text = build_payload(answer, table_format_of(data))
+
+    if is_text:
+        memory.add_user_message(query)
+        memory.add_ai_message(answer)
+
+    return json_response(request, payload)
+
+
+async def ask_stream(request):
+    data = await request.json()
+    query = data["query"]
+    cid = data["conversation_id"]
+
+    memory, intent = await asyncio.to_thread(route, query, cid)
+    agent = agents[intent]
+
+    async def generate():
+        try:
+            with span("answer_cache", "cache"):
+                answer = await asyncio.to_thread(answer_cache.get, intent, query, memory)
+            if answer is None:
+                if is_direct(intent):
+                    with span("direct_tool"):
+                        answer = await arun_direct(intent, query)
+                else:
+                    with span("compaction"):
+                        history = await run_limited("llm", compactor.messages_for, memory, intent)
+                    final = None
+                    async for mode, chunk in agent.astream(
+                        {"messages": build_messages(history, query)},
+                        stream_mode=["messages", "values"]
+                    ):
+                        if mode == "messages":
+                            token, meta = chunk
+                            if meta.get("langgraph_node") == "model" and token.content:
+                                yield sse("token", {"text": token.content})
+                        else:
+                            final = chunk
+                    answer = final["messages"][-1].content if final else ""
+                await asyncio.to_thread(answer_cache.put, intent, query, answer, memory)
+        except Exception as e:
+            yield sse("error", {"error": str(e)})
+            return
+
+        payload, is_text = build_payload(answer, table_format_of(data))
+
+        if is_text:
+            memory.add_user_message(query)
+            memory.add_ai_message(answer)
+
+        yield sse("done", payload)
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def remember(cid, query, answer):
+    memory = get_memory(cid)
+    memory.add_user_message(query)
+    memory.add_ai_message(answer)
+
+
+async def ask_batch(request):
+    data = await request.json()
+    items = data.get("items") or []
+    if len(items) > batch.MAX_ITEMS:
+        return json_response(request, {"error": f"At most {batch.MAX_ITEMS} items per batch"}, 400)
+    table_format = table_format_of(data)
+    # Direct tools answer from the question alone, so their conversations aren't loaded.
+    jobs, invalid = await asyncio.to_thread(
+        batch.plan_batch, items, detect_intent, get_memory, lambda intent: not is_direct(intent)
+    )
+    slots = {intent: asyncio.Semaphore(batch.concurrency(intent)) for intent in {job.intent for job in jobs}}
+
+    async def run(job):
+        # Each job runs in its own task, so its trace (and intent label) is its own.
+        start_trace()
+        set_intent(job.intent)
+        # Interactive /ask calls are admitted to the LLM ahead of batch work.
+        set_priority(BATCH)
+        async with slots[job.intent]:
+            try:
+                return job, await answer_for(job.query, job.memory, job.intent), None
+            except Exception as e:
+                return job, None, str(e)
+
+    async def generate():
+        for i in invalid:
+            yield batch.batch_line(i, items[i], error="Each item needs a query and a conversation_id")
+
+        tasks = [asyncio.ensure_future(run(job)) for job in jobs]
+        try:
+            # Lines go out in completion order; "index" ties them to the request.
+            for next_done in asyncio.as_completed(tasks):
+                job, answer, error = await next_done
+                if error is not None:
+                    for i in job.indexes:
+                        yield batch.batch_line(i, items[i], job.intent, error=error)
+                    continue
+                payload, is_text = build_payload(answer, table_format)
+                for i in job.indexes:
+                    if is_text:
+                        await asyncio.to_thread(remember, items[i]["conversation_id"], items[i]["query"], answer)
+                    yield batch.batch_line(i, items[i], job.intent, payload)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+async def ask_page(request):
+    data = await request.json()
+    try:
+        page = await run_limited("sql", sql_page, data["token"])
+    except (KeyError, ValueError) as e:
+        return json_response(request, {"error": f"Invalid page token: {e}"}, 400)
+    payload, _ = build_payload(page, table_format_of(data))
+    return json_response(request, payload)
+
+
+async def stats(request):
+    return JSONResponse({
+        "memory": memory_store.stats(),
+        "sql_plan_cache": plan_cache.stats(),
+        "sql_result_cache": result_cache.stats(),
+        "sql_schema": catalog.stats(),
+        "policy_index": policy_index.stats() if policy_index is not None else None,
+        "policy_fanout": policy_fanout.stats(),
+        "web_search": web_search.stats(),
+        "history_compaction": compactor.stats(),
+        "answer_cache": answer_cache.stats(),
+        "coalescing": singleflight.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "intent_router": router.stats()
+    })
+
+
+async def metrics(request):
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+async def warmup(request):
+    return JSONResponse(await asyncio.to_thread(warmup_backends))
+
+
+async def index(request):
+    return FileResponse("index.html")
+
+
+app = Starlette(
+    routes=[
+        Route("/ask", ask, methods=["POST"]),
+        Route("/ask/stream", ask_stream, methods=["POST"]),
+        Route("/ask/batch", ask_batch, methods=["POST"]),
+        Route("/ask/page", ask_page, methods=["POST"]),
+        Route("/stats", stats),
+        Route("/metrics", metrics),
+        Route("/warmup", warmup, methods=["POST"]),
+        Route("/", index),
+        Route("/index.html", index),
+    ],
+    middleware=[
+        Middleware(TracingMiddleware),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    ]
+)
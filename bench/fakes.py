@@ -0,0 +1,214 @@
+import asyncio
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import date, timedelta
+
+import httpx
+
+'''
+ Deterministic stand-ins for Azure OpenAI and Azure Search, with latency
+ drawn from a seeded log-normal distribution (median + sigma), so runs
+ are repeatable and comparable without any network access.
+ FakeAzureOpenAI is an HTTP endpoint served through httpx.MockTransport,
+ so calls still go through the app's AzureChatOpenAI clients and the LLM
+ scheduler (admission, retries, circuit breaker).
+ '''
+QUESTION_RE = re.compile(r"User question:\s*(.*)", re.DOTALL)
+NUMBER_RE = re.compile(r"\d+")
+
+POLICY_TOPICS = [
+    ("Leave Policy", "annual leave, sick leave, carry forward and leave encashment"),
+    ("IT Security Policy", "password rules, device usage, remote access and VPN"),
+    ("Travel Reimbursement", "travel claims, per diem, hotel limits and approvals"),
+    ("Code of Conduct", "behaviour guidelines, conflicts of interest and gifts"),
+    ("Work From Home Policy", "remote work eligibility, equipment and working hours"),
+    ("Onboarding SOP", "joining formalities, documents and induction schedule"),
+    ("Data Protection Policy", "confidential data handling, retention and access control"),
+    ("Holiday Calendar", "public holidays, optional holidays and compensatory off"),
+]
+
+
+class LatencyModel:
+    """Log-normal latency: `median_ms` typical, `sigma` controls the tail."""
+
+    def __init__(self, median_ms=0.0, sigma=0.5, seed=0):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self):
+        if not self.median:
+            return 0.0
+        with self._lock:
+            return self.median * math.exp(self.sigma * self._random.gauss(0, 1))
+
+    def sleep(self):
+        delay = self.sample()
+        if delay:
+            time.sleep(delay)
+
+    async def asleep(self):
+        delay = self.sample()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def fake_sql(question: str) -> str:
+    # Vary the filter with the numbers in the question so distinct questions
+    # produce distinct SQL (and miss the result cache) like real traffic would.
+    n = int((NUMBER_RE.findall(question) or ["0"])[-1])
+    if any(k in question.lower() for k in ("chart", "graph", "plot", "visual")):
+        start = date(2023, 1, 1) + timedelta(days=n % 720)
+        return (
+            "SELECT ProductName, SUM(Quantity) AS TotalQuantity FROM dbo.Sales "
+            f"WHERE SaleDate >= '{start}' AND SaleDate < '{start + timedelta(days=7)}' "
+            "GROUP BY ProductName"
+        )
+    return (
+        "SELECT SaleID, ProductName, Quantity, UnitPrice, SaleDate, CustomerName FROM dbo.Sales "
+        f"WHERE CustomerName = 'Customer {n % 5000:04d}' ORDER BY SaleDate DESC"
+    )
+
+
+def chat_reply(body) -> dict:
+    """Assistant message for an OpenAI chat-completions request body.
+
+    Agents (requests with tools) get a call to their first tool, tool
+    results are echoed back, and SQL prompts get SQL.
+    """
+    last = body["messages"][-1]
+    text = last.get("content") or ""
+    if not isinstance(text, str):
+        text = " ".join(part.get("text", "") for part in text if isinstance(part, dict))
+    if last.get("role") == "tool":
+        return {"role": "assistant", "content": text[:2000]}
+    if body.get("tools"):
+        return {"role": "assistant", "content": None, "tool_calls": [{
+            "id": f"call_{abs(hash(text)) % 10 ** 8}",
+            "type": "function",
+            "function": {"name": body["tools"][0]["function"]["name"],
+                         "arguments": json.dumps({"__arg1": text})},
+        }]}
+    match = QUESTION_RE.search(text)
+    if "SELECT query" in text and match:
+        return {"role": "assistant", "content": fake_sql(match.group(1).strip())}
+    if "running summary" in text:
+        return {"role": "assistant", "content": "Summary of the earlier conversation."}
+    return {"role": "assistant", "content": "Day 1: arrive and explore. Day 2: guided tour. Day 3: depart."}
+
+
+def policy_documents(count=200):
+    docs = []
+    for i in range(count):
+        title, topics = POLICY_TOPICS[i % len(POLICY_TOPICS)]
+        name = f"{title} v{i // len(POLICY_TOPICS) + 1}.pdf"
+        docs.append({
+            "id": str(i),
+            "content": f"{title} section {i}: rules covering {topics}. Employees must follow clause {i}.",
+            "metadata_spo_item_name": name,
+            "metadata_spo_item_path": f"/sites/policies/{name}",
+        })
+    return docs
+
+
+class FakeSearchClient:
+    """Keyword-matching stand-in for azure.search.documents.SearchClient."""
+
+    def __init__(self, docs, latency):
+        self.docs = docs
+        self.latency = latency
+        self._terms = [set(re.findall(r"\w+", d["content"].lower())) for d in docs]
+
+    def get_document_count(self):
+        return len(self.docs)
+
+    def search(self, search_text="*", top=None, **kwargs):
+        self.latency.sleep()
+        if search_text == "*":
+            return list(self.docs[:top] if top else self.docs)
+        words = set(re.findall(r"\w+", search_text.lower()))
+        scored = sorted(
+            ((len(words & terms), i) for i, terms in enumerate(self._terms)),
+            key=lambda x: (-x[0], x[1])
+        )
+        return [dict(self.docs[i]) for score, i in scored[:top or 50] if score]
+
+
+class FakeAzureOpenAI:
+    """Chat-completions endpoint with an optional requests-per-second quota.
+
+    Over quota (rps > 0) it answers 429 with retry-after-ms, like Azure
+    OpenAI; a share of the remaining calls can fail with 500. Use as
+    httpx.MockTransport(endpoint) for sync clients and
+    httpx.MockTransport(endpoint.ahandle) for async ones.
+    """
+
+    def __init__(self, rps, latency, error_rate=0.0, seed=0):
+        self.rps = rps
+        self.latency = latency
+        self.error_rate = error_rate
+        self.accepted = 0
+        self.throttled = 0
+        self.failed = 0
+        self._recent = deque()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _admit(self):
+        """Return (429 response or None, whether this call fails)."""
+        with self._lock:
+            if not self.rps:
+                return None, self._random.random() < self.error_rate
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 1:
+                self._recent.popleft()
+            if len(self._recent) >= self.rps:
+                self.throttled += 1
+                wait = 1 - (now - self._recent[0])
+                return httpx.Response(429, headers={"retry-after-ms": str(int(wait * 1000) + 1)},
+                                      json={"error": {"code": "429", "message": "Rate limit exceeded"}}), False
+            self._recent.append(now)
+            return None, self._random.random() < self.error_rate
+
+    def _respond(self, request, failed):
+        if failed:
+            with self._lock:
+                self.failed += 1
+            return httpx.Response(500, json={"error": {"code": "500", "message": "Internal error"}})
+        body = json.loads(request.content)
+        message = chat_reply(body)
+        prompt_tokens = sum(len(str(m.get("content") or "")) for m in body["messages"]) // 4 + 1
+        completion_tokens = len(json.dumps(message)) // 4 + 1
+        with self._lock:
+            self.accepted += 1
+            n = self.accepted
+        return httpx.Response(200, json={
+            "id": f"chatcmpl-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "fake",
+            "choices": [{"index": 0, "message": message,
+                         "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def __call__(self, request):
+        throttled, failed = self._admit()
+        if throttled is not None:
+            return throttled
+        self.latency.sleep()
+        return self._respond(request, failed)
+
+    async def ahandle(self, request):
+        throttled, failed = self._admit()
+        if throttled is not None:
+            return throttled
+        await self.latency.asleep()
+        return self._respond(request, failed)
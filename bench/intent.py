@@ -0,0 +1,86 @@
+import argparse
+import sys
+import time
+
+from agents.intent_classifier import EXAMPLES_PATH, IntentClassifier, load_examples
+from agents.router import keyword_intent
+from bench.run import percentile
+
+'''
+ Accuracy and latency of the intent routers on a labeled set the
+ classifier was not trained on (bench/intent_eval.jsonl by default):
+ the keyword rules, the classifier alone, and the classifier with keyword
+ fallback below --min-confidence (what detect_intent does).
+
+     python -m bench.intent
+     python -m bench.intent --log labeled.jsonl --eval held_out.jsonl --show-errors
+ '''
+
+
+def evaluate(name, route, examples, rounds):
+    predictions = [route(q) for q, _ in examples]
+    timings = []
+    for _ in range(rounds):
+        for q, _ in examples:
+            start = time.perf_counter()
+            route(q)
+            timings.append(time.perf_counter() - start)
+    correct = [p == intent for p, (_, intent) in zip(predictions, examples)]
+    per_intent = {}
+    for ok, (_, intent) in zip(correct, examples):
+        hits, total = per_intent.get(intent, (0, 0))
+        per_intent[intent] = (hits + ok, total + 1)
+    return {
+        "router": name,
+        "accuracy": sum(correct) / len(examples),
+        "per_intent": {i: hits / total for i, (hits, total) in sorted(per_intent.items())},
+        "p50_us": percentile(timings, 50) * 1e6,
+        "p99_us": percentile(timings, 99) * 1e6,
+        "errors": [(q, intent, p) for p, ok, (q, intent) in zip(predictions, correct, examples) if not ok],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Intent router accuracy/latency benchmark.")
+    parser.add_argument("--eval", default="bench/intent_eval.jsonl")
+    parser.add_argument("--log", action="append", default=[], help="extra labeled training data (JSONL)")
+    parser.add_argument("--min-confidence", type=float, default=0.45)
+    parser.add_argument("--rounds", type=int, default=20, help="timing passes over the eval set")
+    parser.add_argument("--show-errors", action="store_true")
+    args = parser.parse_args(argv)
+
+    training = load_examples(EXAMPLES_PATH)
+    for path in args.log:
+        training += load_examples(path)
+    start = time.perf_counter()
+    model = IntentClassifier.train(training)
+    train_ms = (time.perf_counter() - start) * 1000
+    examples = load_examples(args.eval)
+
+    def with_fallback(query):
+        intent, confidence = model.predict(query)
+        return intent if confidence >= args.min_confidence else keyword_intent(query)
+
+    results = [
+        evaluate("keyword", keyword_intent, examples, args.rounds),
+        evaluate("model", lambda q: model.predict(q)[0], examples, args.rounds),
+        evaluate(f"model+fallback@{args.min_confidence:g}", with_fallback, examples, args.rounds),
+    ]
+
+    print(f"trained on {len(training)} examples in {train_ms:.1f}ms, "
+          f"{len(model.vocab)} features; evaluated on {len(examples)} queries")
+    intents = list(results[0]["per_intent"])
+    print(f"{'router':<24}{'accuracy':>9}{'p50 us':>9}{'p99 us':>9}  " + "".join(f"{i:>10}" for i in intents))
+    for r in results:
+        print(f"{r['router']:<24}{r['accuracy']:>9.1%}{r['p50_us']:>9.1f}{r['p99_us']:>9.1f}  "
+              + "".join(f"{r['per_intent'][i]:>10.0%}" for i in intents))
+    if args.show_errors:
+        for r in results:
+            print(f"\n{r['router']} misroutes:")
+            for q, expected, got in r["errors"]:
+                print(f"  {expected:>8} -> {got:<8} {q}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+from langchain_openai import AzureChatOpenAI
+
+from bench.fakes import FakeAzureOpenAI, LatencyModel
+from bench.run import percentile
+from utils.llm_scheduler import BATCH, INTERACTIVE, LLMScheduler, LLMTransport, set_priority
+
+'''
+ Bursts LLM calls at a local endpoint that answers 429 over its quota
+ (and optionally 500s), through the same AzureChatOpenAI client setup and
+ scheduler the app uses. Reports how many calls failed, how many 429s the
+ endpoint sent, and latency for interactive and batch calls.
+
+     python -m bench.llm_quota --calls 100 --quota-rps 10 --rpm 540
+ '''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="LLM scheduler against a rate-limited fake endpoint.")
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-every", type=int, default=2, help="every Nth call is batch priority (0 = none)")
+    parser.add_argument("--quota-rps", type=int, default=10, help="endpoint quota, requests per second")
+    parser.add_argument("--rpm", type=float, default=0, help="scheduler RPM limit (0 = rely on retries)")
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--max-retries", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    endpoint = FakeAzureOpenAI(args.quota_rps, LatencyModel(args.latency_ms), args.error_rate)
+    scheduler = LLMScheduler(rpm=args.rpm, tpm=0, max_retries=args.max_retries)
+    llm = AzureChatOpenAI(
+        azure_endpoint="http://fake-openai.local",
+        api_key="fake",
+        deployment_name="fake",
+        api_version="2024-02-01",
+        max_retries=0,
+        http_client=httpx.Client(transport=LLMTransport(scheduler, httpx.MockTransport(endpoint)))
+    )
+
+    def call(n):
+        priority = BATCH if args.batch_every and n % args.batch_every == 0 else INTERACTIVE
+        set_priority(priority)
+        start = time.perf_counter()
+        try:
+            llm.invoke(f"question {n}")
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        return priority, time.perf_counter() - start, error
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(call, range(args.calls)))
+    wall = time.perf_counter() - start
+
+    errors = [e for _, _, e in results if e]
+    print(f"calls={args.calls} quota={args.quota_rps}/s rpm={args.rpm or 'unlimited'} wall={wall:.1f}s")
+    print(f"ok={len(results) - len(errors)} errors={len(errors)} "
+          f"endpoint 429s={endpoint.throttled} 500s={endpoint.failed}")
+    for name, level in (("interactive", INTERACTIVE), ("batch", BATCH)):
+        latencies = [t for p, t, _ in results if p == level]
+        if latencies:
+            print(f"{name:<12} n={len(latencies):<5} p50={percentile(latencies, 50) * 1000:8.1f}ms "
+                  f"p95={percentile(latencies, 95) * 1000:8.1f}ms")
+    print(f"scheduler: {scheduler.stats()}")
+    if errors:
+        print(f"first error: {errors[0]}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,281 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.seed import seed_sales
+
+'''
+ Offline benchmark: drives the Flask app (or the ASGI app) in-process
+ against fake LLM/search backends and a seeded SQLite Sales table, and
+ reports p50/p95/p99 latency, requests per second and peak RSS per
+ intent and concurrency level.
+
+     python -m bench.run --rows 2000000 --concurrency 1,8,32 --requests 200
+     python -m bench.run --json bench/results.json --baseline bench/baseline.json
+ '''
+INTENTS = {
+    # intent: (question template, expected payload types)
+    "table": ("show sales records for customer {n}", {"table"}),
+    "chart": ("bar chart of sales quantity by product for week {n}", {"image", "chart"}),
+    "policy": ("what does the leave policy say about clause {n}", {"answer"}),
+}
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        # ru_maxrss is KiB on Linux, bytes on macOS; a lifetime peak either way.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RssSampler:
+    """Peak resident set size over one measured phase."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes())
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def configure(args, workdir):
+    """Point every backend at local fakes. Must run before the app is imported."""
+    os.environ.update({
+        "SQL_URL": f"sqlite:///{os.path.abspath(args.db)}",
+        "AZURE_OPENAI_ENDPOINT": "http://bench-openai.local",
+        "AZURE_OPENAI_API_KEY": "bench",
+        "AZURE_OPENAI_DEPLOYMENT": "bench",
+        "AZURE_OPENAI_EMBEDDING_DEPLOYMENT": "",
+        "SEARCH_BACKEND": "fake",
+        "SEARCH_FAKE_LATENCY_MS": str(args.search_ms),
+        "SEARCH_RATE_PER_SEC": "1000000",
+        "MEMORY_BACKEND": "memory",
+        "SQL_PLAN_CACHE_PATH": os.path.join(workdir, "sql_plans.db"),
+        "POLICY_INDEX_PATH": os.path.join(workdir, "policy_index"),
+        "MEMORY_SQLITE_PATH": os.path.join(workdir, "memory.db"),
+    })
+    if args.no_cache:
+        os.environ["ANSWER_CACHE_INTENTS"] = ""
+
+    import httpx
+
+    from bench.fakes import FakeAzureOpenAI, FakeSearchClient, LatencyModel, policy_documents
+    from tools import policy_tool
+    from utils import clients
+    from utils.llm_scheduler import AsyncLLMTransport, LLMTransport, llm_scheduler
+
+    # The real AzureChatOpenAI clients and scheduler, with only the network
+    # hop replaced by the fake endpoint.
+    endpoint = FakeAzureOpenAI(args.llm_quota_rps, LatencyModel(args.llm_ms, args.sigma, args.seed))
+    clients.http_client = clients.Lazy(lambda: httpx.Client(
+        transport=LLMTransport(llm_scheduler, httpx.MockTransport(endpoint)), timeout=60
+    ))
+    clients.http_async_client = clients.Lazy(lambda: httpx.AsyncClient(
+        transport=AsyncLLMTransport(llm_scheduler, httpx.MockTransport(endpoint.ahandle)), timeout=60
+    ))
+    docs = policy_documents()
+    latency = LatencyModel(args.search_ms, args.sigma, args.seed + 1)
+    policy_tool.policy_client = clients.Lazy(lambda: FakeSearchClient(docs, latency))
+    policy_tool.sync_index()
+
+
+def check(intent, status, body):
+    if status != 200:
+        return f"HTTP {status}"
+    payload = json.loads(body)
+    kinds = INTENTS[intent][1]
+    kind = payload.get("type", "answer")
+    if kind not in kinds:
+        return f"expected {'/'.join(sorted(kinds))}, got {kind}"
+    return None
+
+
+def question(intent, n):
+    return INTENTS[intent][0].format(n=n)
+
+
+def run_flask(intent, requests, concurrency, offset):
+    from app import app
+
+    local = threading.local()
+
+    def one(n):
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        start = time.perf_counter()
+        response = client.post("/ask", json={"query": question(intent, n), "conversation_id": f"bench-{n}"})
+        elapsed = time.perf_counter() - start
+        return elapsed, check(intent, response.status_code, response.get_data())
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(one, range(offset, offset + requests)))
+
+
+def run_asgi(intent, requests, concurrency, offset):
+    import httpx
+    from asgi import app
+
+    async def main():
+        limit = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def one(n):
+                async with limit:
+                    start = time.perf_counter()
+                    response = await client.post(
+                        "/ask", json={"query": question(intent, n), "conversation_id": f"bench-{n}"}
+                    )
+                    elapsed = time.perf_counter() - start
+                return elapsed, check(intent, response.status_code, response.content)
+
+            return await asyncio.gather(*(one(n) for n in range(offset, offset + requests)))
+
+    return asyncio.run(main())
+
+
+def measure(runner, intent, requests, concurrency, offset):
+    with RssSampler() as rss:
+        start = time.perf_counter()
+        results = runner(intent, requests, concurrency, offset)
+        wall = time.perf_counter() - start
+    latencies = [elapsed for elapsed, _ in results]
+    errors = [error for _, error in results if error]
+    return {
+        "intent": intent,
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "rps": round(len(results) / wall, 2) if wall else 0.0,
+        "peak_rss_mb": round(rss.peak / 2 ** 20, 1),
+    }
+
+
+def print_table(rows):
+    header = f"{'intent':<8}{'conc':>6}{'reqs':>7}{'errs':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>9}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['intent']:<8}{r['concurrency']:>6}{r['requests']:>7}{r['errors']:>6}"
+              f"{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['rps']:>9.1f}{r['peak_rss_mb']:>9.1f}")
+        if r["first_error"]:
+            print(f"    first error: {r['first_error']}")
+
+
+def regressions(rows, baseline, max_regression):
+    """Rows whose p95 grew by more than max_regression (a fraction) over the baseline."""
+    before = {(b["intent"], b["concurrency"]): b for b in baseline["results"]}
+    failed = []
+    for r in rows:
+        b = before.get((r["intent"], r["concurrency"]))
+        if b and b["p95_ms"] and r["p95_ms"] > b["p95_ms"] * (1 + max_regression):
+            failed.append(f"{r['intent']} @ {r['concurrency']}: p95 {b['p95_ms']} -> {r['p95_ms']} ms")
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark.")
+    parser.add_argument("--server", choices=("flask", "asgi"), default="flask")
+    parser.add_argument("--db", default="bench/data/sales.db")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--intents", default=",".join(INTENTS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=200, help="per intent and level")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests per intent")
+    parser.add_argument("--llm-ms", type=float, default=400, help="median fake LLM latency")
+    parser.add_argument("--llm-quota-rps", type=int, default=0,
+                        help="fake LLM requests/second before 429s (0 = unlimited)")
+    parser.add_argument("--search-ms", type=float, default=80, help="median fake search latency")
+    parser.add_argument("--sigma", type=float, default=0.5, help="log-normal spread of fake latencies")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-cache", action="store_true", help="disable the answer cache")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="compare p95 against an earlier --json file")
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    args = parser.parse_args(argv)
+
+    intents = [i.strip() for i in args.intents.split(",") if i.strip()]
+    unknown = set(intents) - set(INTENTS)
+    if unknown:
+        parser.error(f"unknown intents: {', '.join(sorted(unknown))}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    seed_sales(args.db, args.rows, args.seed)
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    configure(args, workdir)
+    from utils.llm_scheduler import llm_scheduler
+    runner = run_asgi if args.server == "asgi" else run_flask
+
+    # Every request asks a distinct question, so caches see realistic misses.
+    offset = 0
+    for intent in intents:
+        runner(intent, args.warmup, 1, offset)
+        offset += args.warmup
+
+    rows = []
+    for concurrency in levels:
+        for intent in intents:
+            rows.append(measure(runner, intent, args.requests, concurrency, offset))
+            offset += args.requests
+
+    print(f"server={args.server} rows={args.rows:,} llm={args.llm_ms}ms search={args.search_ms}ms sigma={args.sigma}")
+    print_table(rows)
+    print(f"llm scheduler: {llm_scheduler.stats()}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": rows}, f, indent=2)
+
+    status = 1 if any(r["errors"] for r in rows) else 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failed = regressions(rows, json.load(f), args.max_regression)
+        for line in failed:
+            print(f"REGRESSION {line}")
+        status = status or (1 if failed else 0)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+'''
+ Builds a SQLite copy of the Sales table for the benchmark. Rows come from
+ a seeded RNG, so every machine benchmarks the same data; an existing file
+ with the requested row count is reused.
+ '''
+PRODUCTS = [
+    "Prepaid 199", "Prepaid 299", "Prepaid 399", "Prepaid 599", "Postpaid 499",
+    "Postpaid 799", "Postpaid 999", "Data Pack 1GB", "Data Pack 5GB", "Data Pack 10GB",
+    "Roaming Pack", "Family Plan", "Student Plan", "Senior Plan", "Business Plan",
+]
+CUSTOMERS = 5000
+START = date(2023, 1, 1)
+DAYS = 730
+BATCH = 50_000
+
+SCHEMA = """
+CREATE TABLE Sales (
+    SaleID INTEGER PRIMARY KEY,
+    ProductName TEXT NOT NULL,
+    Quantity INTEGER NOT NULL,
+    UnitPrice REAL NOT NULL,
+    SaleDate TEXT NOT NULL,
+    CustomerName TEXT NOT NULL
+)
+"""
+
+
+def row_count(path):
+    if not os.path.exists(path):
+        return 0
+    try:
+        with sqlite3.connect(path) as conn:
+            return conn.execute("SELECT COUNT(*) FROM Sales").fetchone()[0]
+    except sqlite3.Error:
+        return 0
+
+
+def generate(rows, seed):
+    rng = random.Random(seed)
+    days = [(START + timedelta(days=d)).isoformat() for d in range(DAYS)]
+    for i in range(1, rows + 1):
+        product = rng.randrange(len(PRODUCTS))
+        yield (
+            i,
+            PRODUCTS[product],
+            rng.randint(1, 20),
+            round(99 + product * 50 + rng.random() * 10, 2),
+            days[rng.randrange(DAYS)],
+            f"Customer {rng.randrange(CUSTOMERS):04d}",
+        )
+
+
+def seed_sales(path, rows, seed=0):
+    """Create `path` with `rows` Sales rows unless it already has exactly that many."""
+    if row_count(path) == rows:
+        return path
+    if os.path.exists(path):
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    start = time.perf_counter()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.execute(SCHEMA)
+    insert = "INSERT INTO Sales VALUES (?, ?, ?, ?, ?, ?)"
+    batch = []
+    for row in generate(rows, seed):
+        batch.append(row)
+        if len(batch) >= BATCH:
+            conn.executemany(insert, batch)
+            batch.clear()
+    if batch:
+        conn.executemany(insert, batch)
+    # The same indexes a production Sales table would have for these filters.
+    conn.execute("CREATE INDEX IX_Sales_SaleDate ON Sales (SaleDate)")
+    conn.execute("CREATE INDEX IX_Sales_CustomerName ON Sales (CustomerName)")
+    conn.commit()
+    conn.close()
+    print(f"Seeded {rows:,} rows into {path} in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed the benchmark Sales database.")
+    parser.add_argument("--db", default="bench/data/sales.db")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    seed_sales(args.db, args.rows, args.seed)
@@ -1,6 +1,299 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
 from langchain_community.chat_message_histories import ChatMessageHistory
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+MAX_CONVERSATIONS = int(os.getenv("MEMORY_MAX_CONVERSATIONS", "10000"))
+IDLE_TTL = float(os.getenv("MEMORY_IDLE_TTL", "3600"))
+MAX_BYTES = int(os.getenv("MEMORY_MAX_BYTES", str(128 * 1024 * 1024)))
+WINDOW = int(os.getenv("MEMORY_WINDOW", "40"))
+
+# "memory" keeps conversations in this process only; "sqlite" persists them
+# to a WAL-mode file shared by every worker on the host.
+BACKEND = os.getenv("MEMORY_BACKEND", "memory")
+SQLITE_PATH = os.getenv("MEMORY_SQLITE_PATH", "cache/memory.db")
+FLUSH_INTERVAL = float(os.getenv("MEMORY_FLUSH_INTERVAL", "0.2"))
+FLUSH_BATCH = int(os.getenv("MEMORY_FLUSH_BATCH", "500"))
+# Minimum seconds between checks of one conversation for other workers' writes.
+FRESHNESS_INTERVAL = float(os.getenv("MEMORY_FRESHNESS_INTERVAL", "2"))
+
+WORKER_ID = uuid.uuid4().hex
+
+MESSAGE_TYPES = {"human": HumanMessage, "ai": AIMessage, "system": SystemMessage}
+
+
+def history_bytes(history):
+    return sum(len(str(m.content).encode("utf-8")) for m in history.messages)
+
+
+class SQLiteMemoryBackend:
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                cid TEXT,
+                worker TEXT,
+                role TEXT,
+                content TEXT,
+                created REAL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_messages_cid ON messages (cid, id)")
+        self.db.commit()
+        self._lock = threading.Lock()
+
+    def load(self, cid, limit=0):
+        """Return the last `limit` (id, role, content) rows, oldest first."""
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT id, role, content FROM messages WHERE cid = ? ORDER BY id DESC LIMIT ?",
+                (cid, limit or -1)
+            ).fetchall()
+        return rows[::-1]
+
+    def latest_foreign(self, cid, worker):
+        """Highest message id written for `cid` by any other worker."""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT MAX(id) FROM messages WHERE cid = ? AND worker != ?",
+                (cid, worker)
+            ).fetchone()
+        return row[0] or 0
+
+    def count(self, cid):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM messages WHERE cid = ?", (cid,)).fetchone()[0]
+
+    def append_many(self, rows):
+        with self._lock:
+            with self.db:
+                self.db.executemany(
+                    "INSERT INTO messages (cid, worker, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+
+
+class WriteBehindWriter:
+    """Batches message writes and flushes them from a background thread."""
+
+    def __init__(self, backend, interval, batch_size):
+        self.backend = backend
+        self.interval = interval
+        self.batch_size = batch_size
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        threading.Thread(target=self._run, name="memory-flusher", daemon=True).start()
+        atexit.register(self.flush)
+
+    def put(self, row):
+        with self._lock:
+            self._pending.append(row)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self, cid=None):
+        """Write pending rows to the backend; only `cid`'s rows if given."""
+        while True:
+            # Taken per batch, so a single-conversation flush waits for one
+            # batch at most and rows of a conversation stay in order.
+            with self._flush_lock:
+                with self._lock:
+                    if cid is None:
+                        n = min(len(self._pending), self.batch_size)
+                        rows = [self._pending.popleft() for _ in range(n)]
+                    else:
+                        rows = [r for r in self._pending if r[0] == cid]
+                        if rows:
+                            self._pending = deque(r for r in self._pending if r[0] != cid)
+                if not rows:
+                    return
+                try:
+                    self.backend.append_many(rows)
+                except Exception as e:
+                    print(f"Memory flush error: {e}")
+                    # Put the batch back in order and retry on the next tick.
+                    with self._lock:
+                        self._pending.extendleft(reversed(rows))
+                    return
+            if cid is not None:
+                return
+
+
+class WindowedChatMessageHistory(ChatMessageHistory):
+    """Keeps only the last `window` messages and reports writes to the store."""
+
+    cid: str = ""
+    window: int = 0
+    # Highest persisted message id this copy has seen; see ConversationStore.get.
+    seen: int = 0
+    # Number of earlier messages no longer held (trimmed or never loaded).
+    offset: int = 0
+    # Messages trimmed by the window but not yet folded into a summary by
+    # utils/compaction.py (at most `window` of them).
+    trimmed: list = []
+    # When the store last checked the backend for other workers' writes.
+    checked: float = 0.0
+
+    def add_message(self, message):
+        self.append(message)
+        memory_store.update(self.cid, message, self)
+
+    def append(self, message):
+        """Add a message without reporting it to the store."""
+        super().add_message(message)
+        if self.window and len(self.messages) > self.window:
+            trimmed = len(self.messages) - self.window
+            self.trimmed = (self.trimmed + self.messages[:trimmed])[-self.window:]
+            del self.messages[:trimmed]
+            self.offset += trimmed
+
+
+class ConversationStore:
+    """LRU store of conversation histories with idle expiry and a byte cap.
+
+    With a backend configured this is a read cache in front of it: writes
+    go out through the write-behind writer, and a cached conversation is
+    reloaded when another worker has written to it since.
+    """
+
+    def __init__(self, max_conversations, idle_ttl, max_bytes, window, backend=None,
+                 freshness_interval=FRESHNESS_INTERVAL):
+        self.max_conversations = max_conversations
+        self.idle_ttl = idle_ttl
+        self.max_bytes = max_bytes
+        self.window = window
+        self.backend = backend
+        self.freshness_interval = freshness_interval
+        self.writer = WriteBehindWriter(backend, FLUSH_INTERVAL, FLUSH_BATCH) if backend else None
+        self.bytes = 0
+        self.evictions = {"lru": 0, "idle": 0, "bytes": 0}
+        self.loads = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, cid):
+        with self._lock:
+            self._expire(time.monotonic())
+            item = self._data.get(cid)
+        history = item[0] if item else None
+
+        if self.backend is not None:
+            now = time.monotonic()
+            if history is None:
+                history = self._load(cid)
+            elif now - history.checked >= self.freshness_interval:
+                history.checked = now
+                if self.backend.latest_foreign(cid, WORKER_ID) > history.seen:
+                    history = self._load(cid)
+        elif history is None:
+            history = WindowedChatMessageHistory(cid=cid, window=self.window)
+
+        with self._lock:
+            current = self._data.pop(cid, None)
+            if current is not None and current is not item:
+                # Another request created or reloaded it meanwhile; keep that
+                # copy so messages already written to it aren't orphaned.
+                history = current[0]
+            self._data[cid] = (history, time.monotonic())
+            self._resize(cid, history)
+            self._evict(keep=cid)
+        return history
+
+    def _load(self, cid):
+        # Our own unflushed writes to this conversation must be on disk before we re-read.
+        self.writer.flush(cid)
+        rows = self.backend.load(cid, self.window)
+        self.loads += 1
+        return WindowedChatMessageHistory(
+            cid=cid,
+            window=self.window,
+            seen=max((r[0] for r in rows), default=0),
+            checked=time.monotonic(),
+            offset=self.backend.count(cid) - len(rows),
+            messages=[MESSAGE_TYPES.get(role, HumanMessage)(content=content) for _, role, content in rows]
+        )
+
+    def update(self, cid, message=None, history=None):
+        if message is not None and self.writer is not None:
+            self.writer.put((cid, WORKER_ID, message.type, str(message.content), time.time()))
+        with self._lock:
+            item = self._data.get(cid)
+            if item is None:
+                return
+            if message is not None and history is not None and item[0] is not history:
+                # Written through a copy the store has since reloaded or
+                # replaced; the probe skips our own writes, so mirror it here.
+                item[0].append(message)
+            self._data.move_to_end(cid)
+            self._resize(cid, item[0])
+            self._evict(keep=cid)
+
+    def _resize(self, cid, history):
+        size = history_bytes(history)
+        self.bytes += size - self._sizes.get(cid, 0)
+        self._sizes[cid] = size
+
+    def _drop(self, cid, reason):
+        del self._data[cid]
+        self.bytes -= self._sizes.pop(cid, 0)
+        self.evictions[reason] += 1
+
+    def _expire(self, now):
+        # Oldest-used first, so stop at the first conversation still in use.
+        while self._data:
+            cid, (_, last_used) = next(iter(self._data.items()))
+            if last_used + self.idle_ttl >= now:
+                break
+            self._drop(cid, "idle")
+
+    def _evict(self, keep=None):
+        while len(self._data) > self.max_conversations or self.bytes > self.max_bytes:
+            cid = next(iter(self._data))
+            if cid == keep:
+                break
+            self._drop(cid, "lru" if len(self._data) > self.max_conversations else "bytes")
+
+    def stats(self):
+        stats = {
+            "backend": BACKEND,
+            "conversations": len(self._data),
+            "bytes": self.bytes,
+            "evictions": dict(self.evictions),
+            "loads": self.loads,
+        }
+        if self.writer is not None:
+            stats["pending_writes"] = len(self.writer._pending)
+        return stats
+
+
+def create_backend(name):
+    if name == "sqlite":
+        return SQLiteMemoryBackend(SQLITE_PATH)
+    if name == "memory":
+        return None
+    raise ValueError(f"Unknown MEMORY_BACKEND: {name}")
+
+
+memory_store = ConversationStore(
+    MAX_CONVERSATIONS, IDLE_TTL, MAX_BYTES, WINDOW, backend=create_backend(BACKEND)
+)
 
-memory_store = {}
 
 def get_memory(cid):
-    return memory_store.setdefault(cid, ChatMessageHistory())
+    return memory_store.get(cid)
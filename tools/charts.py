@@ -0,0 +1,198 @@
+import base64
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pandas as pd
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from utils.cache import TTLCache
+from utils.tracing import observe_payload, span
+
+'''
+ Chart output for sql_tool. PNGs are drawn with the object-oriented Figure
+ API (no pyplot global state) in a pool of worker processes, and cached by
+ data hash + chart type. CHART_OUTPUT=spec skips rendering altogether and
+ returns the series for index.html to draw with Plotly.
+
+ Workers are spawned, and spawn re-imports the main script in each one:
+ under `python app.py` every chart worker would run app.py's startup, so
+ serve charts through the WSGI/ASGI entry points (gunicorn, uvicorn).
+ '''
+CHART_OUTPUT = os.getenv("CHART_OUTPUT", "image")
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+
+render_cache = TTLCache(
+    maxsize=int(os.getenv("CHART_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("CHART_CACHE_TTL", "600"))
+)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+NUMERIC = ['int64', 'float64']
+
+
+def is_chart_request(question: str) -> bool:
+    return any(k in question.lower() for k in ["graph", "chart", "visual", "plot"])
+
+
+def requested_chart_type(question: str) -> str:
+    q = question.lower()
+    for graph_type in ["bar", "pie", "line", "scatter"]:
+        if graph_type in q:
+            return graph_type
+    return "auto"
+
+
+def prepare_frame(df):
+    # Convert date columns to datetime if present
+    for col in df.columns:
+        if 'date' in col.lower() or pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def resolve_chart_type(df, graph_type: str) -> str:
+    two = len(df.columns) >= 2
+    dtypes = df.dtypes
+    if graph_type == "pie" and two:
+        return "pie"
+    if graph_type == "bar" or (graph_type == "auto" and two and (dtypes.iloc[0] in ['object', 'string'] or dtypes.iloc[0] == 'category') and dtypes.iloc[1] in NUMERIC):
+        return "bar"
+    if graph_type == "line" or (graph_type == "auto" and two and (pd.api.types.is_datetime64_any_dtype(df.iloc[:, 0]) or 'date' in df.columns[0].lower()) and dtypes.iloc[1] in NUMERIC):
+        return "line"
+    if graph_type == "scatter" or (graph_type == "auto" and two and dtypes.iloc[0] in NUMERIC and dtypes.iloc[1] in NUMERIC):
+        return "scatter"
+    return "default"
+
+
+def render_png(df, kind: str) -> bytes:
+    """Draw the chart and return PNG bytes. Runs inside a pool worker."""
+    fig = Figure(figsize=(10, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.subplots()
+
+    if kind == "pie":
+        # Pie chart: assume first column labels, second values
+        ax.pie(df.iloc[:, 1], labels=df.iloc[:, 0], autopct='%1.1f%%')
+        ax.set_title('Pie Chart')
+    elif kind == "bar":
+        ax.bar(df.iloc[:, 0], df.iloc[:, 1])
+        ax.set_title('Bar Chart')
+        ax.set_xlabel(df.columns[0])
+        ax.set_ylabel(df.columns[1])
+        ax.tick_params(axis='x', labelrotation=45)
+    elif kind == "line":
+        # Line chart for time series
+        df = df.sort_values(df.columns[0])
+        ax.plot(df.iloc[:, 0], df.iloc[:, 1], marker='o')
+        ax.set_title('Line Chart')
+        ax.set_xlabel(df.columns[0])
+        ax.set_ylabel(df.columns[1])
+        ax.tick_params(axis='x', labelrotation=45)
+        ax.grid(True)
+    elif kind == "scatter":
+        ax.scatter(df.iloc[:, 0], df.iloc[:, 1])
+        ax.set_title('Scatter Plot')
+        ax.set_xlabel(df.columns[0])
+        ax.set_ylabel(df.columns[1])
+    else:
+        # Default: bar chart
+        if len(df.columns) >= 2:
+            df.plot(kind='bar', x=df.columns[0], y=df.columns[1], ax=ax)
+        else:
+            df.plot(kind='bar', ax=ax)
+        ax.set_title('Data Visualization')
+        ax.tick_params(axis='x', labelrotation=45)
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png')
+    return buf.getvalue()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: forking a threaded server process is not safe.
+                _pool = ProcessPoolExecutor(
+                    max_workers=CHART_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return _pool
+
+
+def reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def render_in_pool(df, kind: str) -> bytes:
+    pool = get_pool()
+    try:
+        return pool.submit(render_png, df, kind).result()
+    except BrokenProcessPool:
+        # A worker died (OOM, crash in matplotlib); rebuild the pool and retry once.
+        reset_pool(pool)
+        return get_pool().submit(render_png, df, kind).result()
+
+
+def data_hash(df) -> str:
+    h = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    h.update(repr(list(df.columns)).encode("utf-8"))
+    return h.hexdigest()
+
+
+def render_image(df, kind: str) -> str:
+    key = (data_hash(df), kind)
+    image_base64 = render_cache.get(key)
+    if image_base64 is None:
+        with span("chart_render", "matplotlib"):
+            if CHART_WORKERS > 0:
+                png = render_in_pool(df, kind)
+            else:
+                png = render_png(df, kind)
+        image_base64 = base64.b64encode(png).decode('utf-8')
+        observe_payload("chart_png", len(png))
+        render_cache.set(key, image_base64)
+    return image_base64
+
+
+def chart_spec(df, kind: str) -> dict:
+    if kind == "line":
+        df = df.sort_values(df.columns[0])
+    if len(df.columns) >= 2:
+        x, y = df.iloc[:, 0], df.iloc[:, 1]
+        x_label, y_label = str(df.columns[0]), str(df.columns[1])
+    else:
+        x, y = pd.Series(range(len(df))), df.iloc[:, 0]
+        x_label, y_label = "", str(df.columns[0])
+
+    if pd.api.types.is_datetime64_any_dtype(x):
+        x = x.dt.strftime("%Y-%m-%d")
+    return {
+        "chart": "bar" if kind == "default" else kind,
+        "x_label": x_label,
+        "y_label": y_label,
+        "x": x.astype(object).where(x.notna(), None).tolist(),
+        "y": pd.to_numeric(y, errors="coerce").fillna(0).tolist(),
+    }
+
+
+def build_chart(df, question: str) -> dict:
+    """Return the tool payload for a chart question: an image or a spec."""
+    df = prepare_frame(df)
+    kind = resolve_chart_type(df, requested_chart_type(question))
+    if CHART_OUTPUT == "spec":
+        return {"type": "chart", "data": chart_spec(df, kind)}
+    return {"type": "image", "data": render_image(df, kind)}
@@ -1,37 +1,57 @@
 from langchain_core.tools import Tool
-from ddgs import DDGS
 import json
+from tools.web_search import web_search
+from utils.limits import run_limited
+from utils.singleflight import coalesce
+from utils.tracing import span, tool_failed
+@coalesce("internet")
 def internet_agent_with_citations(question: str) -> dict:
     try:
-        with DDGS() as ddgs:
-            results = ddgs.text(question, max_results=5)
-            bodies = []
-            citations = []
-            
-            for r in results:
-                if r.get("body"):
-                    bodies.append(r.get("body", ""))
-                    citations.append({
-                        "title": r.get("title", "Web Result"),
-                        "url": r.get("href", "#")
-                    })
-            
-            answer = "\n".join(bodies) if bodies else "No internet results found."
-            if citations:
-                answer += "\n\n[CITATIONS_METADATA]" + json.dumps(citations) + "[/CITATIONS_METADATA]"
-            return {"answer": answer, "citations": citations}
+        with span("internet_search", "search"):
+            results = web_search.search(question, max_results=5)
+        bodies = []
+        citations = []
+        
+        for r in results:
+            if r.get("body"):
+                bodies.append(r.get("body", ""))
+                citations.append({
+                    "title": r.get("title", "Web Result"),
+                    "url": r.get("href", "#")
+                })
+        
+        answer = "\n".join(bodies) if bodies else "No internet results found."
+        if citations:
+            answer += "\n\n[CITATIONS_METADATA]" + json.dumps(citations) + "[/CITATIONS_METADATA]"
+        return {"answer": answer, "citations": citations}
     except Exception as e:
-        return {"answer": f"Internet search error: {str(e)}", "citations": []}
+        return {"answer": f"Internet search error: {str(e)}", "citations": [], "error": True}
 
 
 def internet_agent(question: str):
     result = internet_agent_with_citations(question)
+    # Marked here, not in the coalesced call, so every caller's trace sees it.
+    if result.get("error"):
+        tool_failed("internet")
+    return result["answer"]
+
+
+@coalesce("internet")
+async def internet_agent_with_citations_async(question: str) -> dict:
+    return await run_limited("search", internet_agent_with_citations, question)
+
+
+async def internet_agent_async(question: str):
+    result = await internet_agent_with_citations_async(question)
+    if result.get("error"):
+        tool_failed("internet")
     return result["answer"]
 
 
 internet_tool = Tool(
     name="InternetSearch",
     func=internet_agent,
+    coroutine=internet_agent_async,
    description=(
     "Use this tool for general web searches and public information lookup using DuckDuckGo.\n"
     "Do NOT use this tool for internal company policy questions.\n"
@@ -0,0 +1,240 @@
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from utils.cache import TTLCache
+from utils.clean_text import stem
+from utils.clients import embeddings
+from utils.embeddings import get_embedder
+
+'''
+ Local retrieval tier for PolicySearch. The policy corpus is small and
+ changes rarely, so it is mirrored from the Azure Search index into a
+ directory on disk and queried in-process: BM25 over the document text,
+ plus cosine similarity against an embedding matrix that is memory-mapped
+ (np.load(mmap_mode="r")) rather than read into every worker. The two
+ rankings are merged with reciprocal rank fusion.
+
+ Sync is incremental: documents are compared by content hash, so only new
+ or changed documents are re-embedded, and the vectors file is only
+ rewritten when something changed. A changed index is written as a new
+ vectors file plus an atomic swap of the manifest, so readers never see a
+ half-written index.
+ '''
+WORD_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "in", "is", "it", "me", "my", "of", "on", "or", "our", "the", "to", "what", "when",
+    "where", "which", "who", "with", "you", "your",
+}
+FIELDS = ("content", "metadata_spo_item_name", "metadata_spo_item_path")
+RRF_K = 60
+
+
+def tokenize(text: str) -> list:
+    return [stem(w) for w in WORD_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+def content_hash(doc: dict) -> str:
+    return hashlib.sha1(json.dumps([doc.get(f) for f in FIELDS]).encode("utf-8")).hexdigest()
+
+
+class BM25:
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.n = len(texts)
+        tokenized = [tokenize(t) for t in texts]
+        self.lengths = np.array([len(t) for t in tokenized], dtype=np.float32)
+        self.avgdl = float(self.lengths.mean()) if self.n and self.lengths.sum() else 1.0
+
+        postings = defaultdict(lambda: ([], []))
+        for i, tokens in enumerate(tokenized):
+            for term, tf in Counter(tokens).items():
+                postings[term][0].append(i)
+                postings[term][1].append(tf)
+        self.postings = {
+            term: (np.array(docs), np.array(tfs, dtype=np.float32))
+            for term, (docs, tfs) in postings.items()
+        }
+
+    def scores(self, query: str):
+        scores = np.zeros(self.n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            docs, tf = self.postings[term]
+            idf = math.log(1 + (self.n - len(docs) + 0.5) / (len(docs) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / self.avgdl)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+
+class PolicyIndex:
+    def __init__(self, path, fetch, sync_interval=3600, min_similarity=0.3):
+        self.path = path
+        self.fetch = fetch
+        self.sync_interval = sync_interval
+        self.min_similarity = min_similarity
+        self.docs = []
+        self.vectors = None
+        self.bm25 = BM25([])
+        self.synced_at = 0.0
+        self.syncs = 0
+        self.searches = 0
+        # The query embedding is the one remote call on this path.
+        self.query_vectors = TTLCache(maxsize=1024, ttl=sync_interval)
+        self._mtime = None
+        self._syncing = False
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    @property
+    def manifest(self):
+        return os.path.join(self.path, "index.json")
+
+    def load(self):
+        """(Re)load the on-disk index if another process or a sync changed it."""
+        try:
+            mtime = os.path.getmtime(self.manifest)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+        with open(self.manifest, encoding="utf-8") as f:
+            manifest = json.load(f)
+        docs = manifest["docs"]
+        vectors = None
+        if manifest.get("vectors"):
+            vectors = np.load(os.path.join(self.path, manifest["vectors"]), mmap_mode="r")
+        bm25 = BM25([d.get("content") or "" for d in docs])
+        with self._lock:
+            self.docs, self.vectors, self.bm25 = docs, vectors, bm25
+            self.synced_at = manifest.get("synced_at", 0.0)
+            self._mtime = mtime
+
+    def sync(self):
+        """Pull the source index and rewrite the local copy if anything changed."""
+        with self._sync_lock:
+            self.load()
+            old = {d["key"]: (d, i) for i, d in enumerate(self.docs)}
+            docs = []
+            for r in self.fetch():
+                doc = {f: r.get(f) for f in FIELDS}
+                if not doc["content"]:
+                    continue
+                doc["hash"] = content_hash(doc)
+                doc["key"] = str(r.get("id") or doc["hash"])
+                docs.append(doc)
+
+            unchanged = [
+                d["key"] in old and old[d["key"]][0]["hash"] == d["hash"] for d in docs
+            ]
+            embed = get_embedder()
+            if all(unchanged) and len(docs) == len(self.docs) and (self.vectors is not None or embed is None):
+                self._write(self.docs, None, keep_vectors=True)
+                return
+
+            vectors_name = None
+            if embed is not None and docs:
+                reuse = self.vectors is not None
+                changed = [d["content"] for d, same in zip(docs, unchanged) if not (same and reuse)]
+                fresh = iter(embeddings.get().embed_documents(changed) if changed else [])
+                rows = []
+                for d, same in zip(docs, unchanged):
+                    if same and reuse:
+                        rows.append(np.asarray(self.vectors[old[d["key"]][1]]))
+                    else:
+                        v = np.asarray(next(fresh), dtype=np.float32)
+                        norm = np.linalg.norm(v)
+                        rows.append(v / norm if norm else v)
+                vectors_name = f"vectors-{int(time.time() * 1000)}.npy"
+                os.makedirs(self.path, exist_ok=True)
+                np.save(os.path.join(self.path, vectors_name), np.vstack(rows).astype(np.float32))
+            self._write(docs, vectors_name)
+
+    def _write(self, docs, vectors_name, keep_vectors=False):
+        os.makedirs(self.path, exist_ok=True)
+        previous = None
+        if os.path.exists(self.manifest):
+            with open(self.manifest, encoding="utf-8") as f:
+                previous = json.load(f).get("vectors")
+        if keep_vectors:
+            vectors_name = previous
+
+        tmp = f"{self.manifest}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"synced_at": time.time(), "vectors": vectors_name, "docs": docs}, f)
+        os.replace(tmp, self.manifest)
+        self.syncs += 1
+        self.load()
+
+        if previous and previous != vectors_name:
+            # Open memory maps keep the old file alive on POSIX; on Windows
+            # the delete fails while another worker still has it mapped.
+            try:
+                os.remove(os.path.join(self.path, previous))
+            except OSError:
+                pass
+
+    def _sync_in_background(self):
+        try:
+            self.sync()
+        except Exception as e:
+            print(f"Policy index sync error: {e}")
+        finally:
+            self._syncing = False
+
+    def maybe_sync(self):
+        self.load()
+        if time.time() - self.synced_at > self.sync_interval and not self._syncing:
+            self._syncing = True
+            threading.Thread(target=self._sync_in_background, name="policy-index-sync", daemon=True).start()
+
+    def search(self, question: str, top: int = 5):
+        """Return up to `top` documents, or None when there is no local index yet."""
+        self.maybe_sync()
+        with self._lock:
+            docs, vectors, bm25 = self.docs, self.vectors, self.bm25
+        if not docs:
+            return None
+        self.searches += 1
+
+        fused = defaultdict(float)
+        lexical = bm25.scores(question)
+        for rank, i in enumerate(np.argsort(-lexical)[:top * 4]):
+            if lexical[i] <= 0:
+                break
+            fused[int(i)] += 1 / (RRF_K + rank)
+
+        embed = get_embedder() if vectors is not None else None
+        if embed is not None:
+            q = self.query_vectors.get(question)
+            if q is None:
+                q = embed(question)
+                self.query_vectors.set(question, q)
+            norm = np.linalg.norm(q)
+            similarity = vectors @ (q / norm if norm else q)
+            for rank, i in enumerate(np.argsort(-similarity)[:top * 4]):
+                if similarity[i] < self.min_similarity:
+                    break
+                fused[int(i)] += 1 / (RRF_K + rank)
+
+        best = sorted(fused, key=lambda i: -fused[i])[:top]
+        return [{f: docs[i].get(f) for f in FIELDS} for i in best]
+
+    def stats(self):
+        return {
+            "documents": len(self.docs),
+            "dense": self.vectors is not None,
+            "synced_at": self.synced_at,
+            "syncs": self.syncs,
+            "searches": self.searches,
+        }
@@ -5,103 +5,170 @@ from langchain_core.tools import Tool
 from azure.search.documents import SearchClient
 from azure.core.credentials import AzureKeyCredential
 from tools.internet_tool import internet_agent_with_citations
-
-policy_client = SearchClient(
+from tools.policy_index import PolicyIndex
+from utils.fanout import FanOut, Source
+from utils.limits import run_limited
+from utils.singleflight import coalesce
+from utils.tracing import span, tool_failed
+from utils.clients import Lazy
+
+policy_client = Lazy(lambda: SearchClient(
     endpoint=os.getenv("AZURE_SEARCH_ENDPOINT"),
     index_name=os.getenv("AZURE_SEARCH_INDEX"),
     credential=AzureKeyCredential(os.getenv("AZURE_SEARCH_KEY"))
-)
+))
 
 
-def policy_tool_func(question: str) -> str:
-    try:
-        results = policy_client.search(search_text=question, top=5)
-        docs = []
-        citations = []
-        sharepoint_base = os.getenv("SHAREPOINT_BASE_URL", "")
+def fetch_all_policies():
+    return policy_client.get().search(search_text="*")
+
+
+# Local mirror of the Azure index; POLICY_LOCAL_INDEX=0 always searches Azure.
+policy_index = PolicyIndex(
+    path=os.getenv("POLICY_INDEX_PATH", "cache/policy_index"),
+    fetch=fetch_all_policies,
+    sync_interval=float(os.getenv("POLICY_INDEX_SYNC_INTERVAL", "3600")),
+    min_similarity=float(os.getenv("POLICY_INDEX_MIN_SIMILARITY", "0.3"))
+) if os.getenv("POLICY_LOCAL_INDEX", "1") == "1" else None
+
+
+def warmup():
+    return policy_client.get().get_document_count()
+
+
+def sync_index():
+    if policy_index is not None:
+        policy_index.sync()
+
+
+def search_policies(question: str, top: int = 5):
+    # Azure Search stays the fallback while the local index is empty or
+    # has nothing for this question (it may not have synced the document yet).
+    if policy_index is not None:
+        try:
+            with span("policy_index", "local_index"):
+                results = policy_index.search(question, top=top)
+            if results:
+                return results
+        except Exception as e:
+            print(f"Policy index error: {e}")
+    with span("policy_search", "azure_search"):
+        # Materialize inside the span; the pager fetches lazily.
+        return list(policy_client.get().search(search_text=question, top=top))
+
+
+def internal_answer(question: str):
+    """Answer from the policy documents, or None when nothing matched."""
+    results = search_policies(question)
+    docs = []
+    citations = []
+    sharepoint_base = os.getenv("SHAREPOINT_BASE_URL", "")
+    
+    for idx, r in enumerate(results):
+        # print(f"\n--- Result {idx} ---")
         
-        for idx, r in enumerate(results):
-            # print(f"\n--- Result {idx} ---")
+        if r.get("content"):
+            docs.append(r.get("content", ""))
+            
+            # Extract correct metadata
+            file_name = r.get("metadata_spo_item_name", "Document")
+            file_path = r.get("metadata_spo_item_path", "")
+            
+            # print(f"File name: {file_name}")
+            # print(f"File path: {file_path}")
             
-            if r.get("content"):
-                docs.append(r.get("content", ""))
-                
-                # Extract correct metadata
-                file_name = r.get("metadata_spo_item_name", "Document")
-                file_path = r.get("metadata_spo_item_path", "")
-                
-                # print(f"File name: {file_name}")
-                # print(f"File path: {file_path}")
-                
-                # Construct proper SharePoint URL
-                if sharepoint_base:
-                    # Build URL from SharePoint base + Shared Documents + filename
-                    source_url = f"{sharepoint_base}/{file_name}"
-                else:
-                    source_url = f"Internal Document: {file_name}"
-                
-                # print(f"Final URL: {source_url}")
-                citations.append({"title": file_name, "url": source_url})
-
-        if docs:
-            answer_text = "\n".join(docs)
-            # Append citations metadata to the answer for later extraction
-            if citations:
-                metadata = json.dumps(citations)
-                answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
-                # print(f"Appending citations metadata: {metadata}")
-            return answer_text
-
-        result = internet_agent_with_citations(question + " government policy")
-        answer_text = result["answer"]
-        if result.get("citations"):
-            metadata = json.dumps(result["citations"])
-            answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
-        return answer_text
-
-    except Exception as e:
-        print(f"Policy tool error: {e}")
-        result = internet_agent_with_citations(question + " government policy")
-        answer_text = result["answer"]
-        if result.get("citations"):
-            metadata = json.dumps(result["citations"])
-            answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
-        return answer_text
-
-        if docs:
-            answer_text = "\n".join(docs)
-            # Append citations metadata to the answer for later extraction
-            if citations:
-                metadata = json.dumps(citations)
-                answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
-                print(f"Appending citations metadata: {metadata}")
-            return answer_text
-
-        result = internet_agent_with_citations(question + " government policy")
-        answer_text = result["answer"]
-        if result.get("citations"):
-            metadata = json.dumps(result["citations"])
-            answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
-        return answer_text
-
-    except Exception as e:
-        print(f"Policy tool error: {e}")
-        result = internet_agent_with_citations(question + " government policy")
-        answer_text = result["answer"]
-        if result.get("citations"):
-            metadata = json.dumps(result["citations"])
-            answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
-        return answer_text
-        result = internet_agent_with_citations(question + " government policy")
-        answer_text = result["answer"]
-        if result.get("citations"):
-            answer_text += "\n\n[CITATIONS_METADATA]" + json.dumps(result["citations"]) + "[/CITATIONS_METADATA]"
-        return answer_text
+            # Construct proper SharePoint URL
+            if sharepoint_base:
+                # Build URL from SharePoint base + Shared Documents + filename
+                source_url = f"{sharepoint_base}/{file_name}"
+            else:
+                source_url = f"Internal Document: {file_name}"
+            
+            # print(f"Final URL: {source_url}")
+            citations.append({"title": file_name, "url": source_url})
+
+    if not docs:
+        return None
+    answer_text = "\n".join(docs)
+    # Append citations metadata to the answer for later extraction
+    if citations:
+        metadata = json.dumps(citations)
+        answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
+        # print(f"Appending citations metadata: {metadata}")
+    return answer_text
+
+
+def web_answer(question: str):
+    """Answer from a web search, or None when the search failed."""
+    result = internet_agent_with_citations(question + " government policy")
+    if result.get("error"):
+        return None
+    answer_text = result["answer"]
+    if result.get("citations"):
+        metadata = json.dumps(result["citations"])
+        answer_text += "\n\n[CITATIONS_METADATA]" + metadata + "[/CITATIONS_METADATA]"
+    return answer_text
+
+
+# Internal documents and the government-policy web search run as a race
+# (utils/fanout.py): the web search starts if internal hasn't answered
+# within POLICY_HEDGE_MS, and a web answer that arrives first is held for
+# up to POLICY_PREFER_INTERNAL_MS in case the internal one follows.
+HEDGE = float(os.getenv("POLICY_HEDGE_MS", "150")) / 1000
+PREFER_INTERNAL = float(os.getenv("POLICY_PREFER_INTERNAL_MS", "300")) / 1000
+INTERNAL_DEADLINE = float(os.getenv("POLICY_INTERNAL_DEADLINE_MS", "3000")) / 1000
+WEB_DEADLINE = float(os.getenv("POLICY_WEB_DEADLINE_MS", "15000")) / 1000
+
+policy_fanout = FanOut(max_workers=int(os.getenv("POLICY_FANOUT_WORKERS", "16")))
+
+
+def policy_sources(question: str):
+    return [
+        Source("internal", lambda: internal_answer(question),
+               afunc=lambda: run_limited("search", internal_answer, question),
+               deadline=INTERNAL_DEADLINE),
+        Source("web", lambda: web_answer(question),
+               afunc=lambda: run_limited("search", web_answer, question),
+               delay=HEDGE, deadline=WEB_DEADLINE),
+    ]
+
+
+NO_ANSWER = "No policy documents or internet results found."
+
+
+@coalesce("policy")
+def policy_answer(question: str):
+    _, answer = policy_fanout.run(policy_sources(question), prefer_within=PREFER_INTERNAL)
+    return answer
+
+
+@coalesce("policy")
+async def policy_aanswer(question: str):
+    _, answer = await policy_fanout.arun(policy_sources(question), prefer_within=PREFER_INTERNAL)
+    return answer
+
+
+def checked(answer) -> str:
+    # Nothing from any source also covers errors and deadlines; the answer
+    # must not be cached, so the turn is marked (per caller, not per flight).
+    if not answer:
+        tool_failed("policy")
+        return NO_ANSWER
+    return answer
+
+
+def policy_tool_func(question: str) -> str:
+    return checked(policy_answer(question))
+
+
+async def policy_tool_afunc(question: str) -> str:
+    return checked(await policy_aanswer(question))
 
 
 policy_tool = Tool(
     name="PolicySearch",
     func=policy_tool_func,
+    coroutine=policy_tool_afunc,
    description=(
     "Use this tool ONLY for company policy or internal document queries.\n\n"
     "This tool must be triggered whenever the user asks about:\n"
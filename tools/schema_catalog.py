@@ -0,0 +1,133 @@
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import inspect
+
+from utils.clean_text import stem
+from utils.embeddings import get_embedder
+
+'''
+ Database schema for the SQL prompt. The catalog introspects the database
+ once (SQLAlchemy inspector over INFORMATION_SCHEMA), refreshes it every
+ refresh_interval seconds, and for each question renders only the tables
+ and columns that look relevant, so the prompt stays small as the
+ warehouse grows. After a failed introspection it waits retry_interval
+ seconds before trying again, so an outage doesn't cost every request an
+ attempt.
+ '''
+WORD_RE = re.compile(r"[a-z0-9]+")
+CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def question_words(question: str) -> set:
+    return {stem(w) for w in WORD_RE.findall(question.lower())}
+
+
+def identifier_words(name: str) -> set:
+    return {stem(w.lower()) for w in CAMEL_RE.findall(name)} | {stem(name.lower())}
+
+
+def is_key_column(table: str, column: str) -> bool:
+    c = column.lower()
+    return c.endswith("id") or c == f"{stem(table.lower())}id"
+
+
+class SchemaCatalog:
+    def __init__(self, engine, schema=None, refresh_interval=3600, max_tables=4,
+                 max_columns=12, match="keyword", retry_interval=30):
+        self.engine = engine
+        self.schema = schema
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.max_tables = max_tables
+        self.max_columns = max_columns
+        self.match = match
+        self.tables = {}
+        self.fingerprint = ""
+        self.vectors = {}
+        self.refreshes = 0
+        self.errors = 0
+        self._loaded_at = 0.0
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        inspector = inspect(self.engine.get())
+        tables = {}
+        for table in sorted(inspector.get_table_names(schema=self.schema)):
+            columns = inspector.get_columns(table, schema=self.schema)
+            tables[table] = [c["name"] for c in columns]
+
+        fingerprint = hashlib.sha1(repr(sorted(tables.items())).encode("utf-8")).hexdigest()
+        vectors = self.vectors if fingerprint == self.fingerprint else {}
+        embed = get_embedder() if self.match == "embedding" else None
+        if embed is not None and not vectors:
+            vectors = {t: embed(f"{t}: {', '.join(cols)}") for t, cols in tables.items()}
+
+        self.tables, self.fingerprint, self.vectors = tables, fingerprint, vectors
+        self._loaded_at = time.monotonic()
+        self.refreshes += 1
+
+    def _due(self):
+        now = time.monotonic()
+        if self._failed_at is not None and now - self._failed_at < self.retry_interval:
+            return False
+        return now - self._loaded_at > self.refresh_interval or not self.tables
+
+    def ensure_loaded(self):
+        """Introspect if due. Raises if that fails; stale tables are kept meanwhile."""
+        if self._due():
+            with self._lock:
+                if self._due():
+                    try:
+                        self.refresh()
+                        self._failed_at = None
+                    except Exception:
+                        self._failed_at = time.monotonic()
+                        self.errors += 1
+                        raise
+
+    def _scores(self, question):
+        words = question_words(question)
+        scores = {}
+        for table, columns in self.tables.items():
+            score = 3 * len(words & identifier_words(table))
+            score += sum(1 for c in columns if words & identifier_words(c))
+            scores[table] = float(score)
+
+        if self.vectors:
+            embed = get_embedder()
+            q = embed(question)
+            q = q / (np.linalg.norm(q) or 1.0)
+            for table, v in self.vectors.items():
+                scores[table] += 5 * float(q @ (v / (np.linalg.norm(v) or 1.0)))
+        return scores
+
+    def relevant(self, question):
+        """Return {table: [columns]} to show the model for this question."""
+        self.ensure_loaded()
+        scores = self._scores(question)
+        ranked = sorted(self.tables, key=lambda t: -scores[t])
+        picked = [t for t in ranked if scores[t] > 0][:self.max_tables] or ranked[:self.max_tables]
+
+        words = question_words(question)
+        selected = {}
+        for table in picked:
+            columns = self.tables[table]
+            if len(columns) > self.max_columns:
+                keep = [c for c in columns if is_key_column(table, c) or words & identifier_words(c)]
+                columns = (keep or columns)[:self.max_columns]
+            selected[table] = columns
+        return selected
+
+    def render(self, question):
+        return "\n\n".join(
+            f"{table}(\n" + ",\n".join(f"  {c}" for c in columns) + "\n)"
+            for table, columns in self.relevant(question).items()
+        )
+
+    def stats(self):
+        return {"tables": len(self.tables), "refreshes": self.refreshes, "errors": self.errors}
@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from utils.cache import TTLCache
+from utils.clean_text import normalize_query
+from utils.clients import Lazy
+from utils.embeddings import VectorIndex, get_embedder
+
+'''
+ Question -> generated SQL cache for sql_tool. Lookups go memory (LRU/TTL),
+ then the SQLite tier on disk, then (optionally) embedding similarity.
+ Entries are tagged with a version so a changed prompt or schema never
+ serves SQL that was generated for the old one. The SQLite file is opened
+ on first use, not when the cache is constructed.
+ '''
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+QUOTED_RE = re.compile(r"'([^']*)'|\"([^\"]*)\"")
+
+
+def literals(question: str) -> str:
+    # Numbers and quoted values end up in the SQL, so questions that differ
+    # only in them ("sales in 2023" / "sales in 2024") must not share a plan.
+    quoted = [a or b for a, b in QUOTED_RE.findall(question)]
+    return json.dumps([NUMBER_RE.findall(question), quoted])
+
+
+class SQLPlanCache:
+    def __init__(self, path, version=None, maxsize=1024, ttl=None, threshold=0.97):
+        self.path = path
+        self.version = version
+        self.ttl = ttl
+        self.threshold = threshold
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.index = None
+        self.hits = 0
+        self.misses = 0
+        self.semantic_hits = 0
+        self._lock = threading.Lock()
+        self._db = Lazy(self._connect)
+
+    @property
+    def db(self):
+        return self._db.get()
+
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS plans (
+                key TEXT PRIMARY KEY,
+                version TEXT,
+                sql TEXT,
+                embedding BLOB,
+                created REAL,
+                literals TEXT
+            )
+        """)
+        columns = {row[1] for row in db.execute("PRAGMA table_info(plans)")}
+        if "literals" not in columns:
+            db.execute("ALTER TABLE plans ADD COLUMN literals TEXT")
+        db.commit()
+        return db
+
+    def set_version(self, version):
+        """Switch to a new prompt/schema version, dropping in-memory entries."""
+        if version != self.version:
+            self.version = version
+            self.memory.clear()
+            self.index = None
+
+    def _key(self, question):
+        return hashlib.sha1(normalize_query(question).encode("utf-8")).hexdigest()
+
+    def _load(self, key, literals=None):
+        with self._lock:
+            row = self.db.execute(
+                "SELECT sql, created, literals FROM plans WHERE key = ? AND version = ?",
+                (key, self.version)
+            ).fetchone()
+        if row is None:
+            return None
+        sql, created, stored = row
+        if self.ttl and created + self.ttl < time.time():
+            return None
+        if literals is not None and stored != literals:
+            return None
+        return sql
+
+    def _semantic_index(self):
+        # Built once from disk on the first similarity lookup.
+        if self.index is None:
+            index = VectorIndex()
+            with self._lock:
+                rows = self.db.execute(
+                    "SELECT key, embedding FROM plans WHERE version = ? AND embedding IS NOT NULL",
+                    (self.version,)
+                ).fetchall()
+            for key, blob in rows:
+                index.add(key, np.frombuffer(blob, dtype=np.float32))
+            self.index = index
+        return self.index
+
+    def get(self, question):
+        key = self._key(question)
+        sql = self.memory.get(key)
+        if sql is None:
+            sql = self._load(key)
+            if sql is not None:
+                self.memory.set(key, sql)
+
+        if sql is None:
+            embed = get_embedder()
+            if embed is not None:
+                index = self._semantic_index()
+                match, _ = index.search(embed(normalize_query(question)), self.threshold)
+                if match is not None:
+                    sql = self._load(match, literals(question))
+                    if sql is not None:
+                        self.semantic_hits += 1
+                        self.memory.set(key, sql)
+
+        if sql is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return sql
+
+    def put(self, question, sql):
+        key = self._key(question)
+        self.memory.set(key, sql)
+
+        embedding = None
+        embed = get_embedder()
+        if embed is not None:
+            vector = embed(normalize_query(question))
+            embedding = vector.tobytes()
+            self._semantic_index().add(key, vector)
+
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO plans (key, version, sql, embedding, created, literals) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.version, sql, embedding, time.time(), literals(question))
+            )
+            self.db.commit()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "semantic_hits": self.semantic_hits,
+            "memory": self.memory.stats(),
+        }
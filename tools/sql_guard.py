@@ -0,0 +1,171 @@
+import re
+import time
+
+from sqlalchemy import event, text
+
+from utils.cache import TTLCache
+
+'''
+ Pre-execution checks for LLM-generated SQL: cap the row count with TOP /
+ LIMIT when the outer query has none, estimate its cost from the plan and
+ reject anything over budget, and bound every statement with a timeout.
+ Limits inside subqueries don't count; compound (UNION) queries on SQL
+ Server are wrapped in a derived table so the cap covers every branch.
+
+ SQL Server uses SHOWPLAN_XML (StatementSubTreeCost / StatementEstRows).
+ SQLite, the local stand-in, has no cost model, so the estimate there is
+ the product of the row counts of every table the plan fully scans, which
+ is what a nested-loop cross join would actually touch.
+ '''
+
+
+class QueryRejected(Exception):
+    pass
+
+
+# Literals and quoted names are kept; comments are dropped.
+TOKEN_RE = re.compile(r"('(?:[^']|'')*'|\"[^\"]*\"|\[[^\]]*\])|--[^\n]*|/\*.*?\*/", re.DOTALL)
+SELECT_RE = re.compile(r"\bselect\s+(distinct\s+)?", re.IGNORECASE)
+TOP_RE = re.compile(r"\s*top\b", re.IGNORECASE)
+LIMIT_RE = re.compile(r"\blimit\s+\d+|\bfetch\s+(next|first)\b", re.IGNORECASE)
+UNION_RE = re.compile(r"\b(union|intersect|except)\b", re.IGNORECASE)
+ORDER_RE = re.compile(r"\border\s+by\b", re.IGNORECASE)
+COST_RE = re.compile(r'StatementSubTreeCost="([^"]+)"')
+ROWS_RE = re.compile(r'StatementEstRows="([^"]+)"')
+# "SCAN t USING COVERING INDEX ..." still reads every row; SEARCH doesn't match.
+SCAN_RE = re.compile(r"^SCAN (?:TABLE )?([\w.]+)", re.IGNORECASE)
+# "FROM dbo.Sales s", "JOIN Customers AS c", ", dbo.Sales b" -> alias/table pairs
+ALIAS_RE = re.compile(
+    r"(?:\bfrom\b|\bjoin\b|,)\s*((?:\w+\.)?\w+)"
+    r"(?:\s+(?:as\s+)?(?!(?:where|join|on|group|order|inner|left|right|full|cross|limit|union|having)\b)(\w+))?",
+    re.IGNORECASE
+)
+
+table_rows = TTLCache(maxsize=1024, ttl=300)
+
+
+def strip_comments(sql: str) -> str:
+    return TOKEN_RE.sub(lambda m: m.group(1) or " ", sql).strip().rstrip(";").rstrip()
+
+
+def top_level(sql: str) -> str:
+    """`sql` with literals and everything inside parentheses blanked out,
+    so offsets still line up but only the outer query can match."""
+    masked = TOKEN_RE.sub(lambda m: " " * len(m.group(0)), sql)
+    out, depth = [], 0
+    for ch in masked:
+        if ch == "(":
+            depth += 1
+        out.append(ch if depth == 0 else " ")
+        if ch == ")":
+            depth = max(depth - 1, 0)
+    return "".join(out)
+
+
+def add_row_limit(sql: str, limit: int, dialect: str) -> str:
+    """Cap the outer query at `limit` rows unless it already has a limit."""
+    sql = strip_comments(sql)
+    outer = top_level(sql)
+    if LIMIT_RE.search(outer):
+        return sql
+    if dialect == "sqlite":
+        # LIMIT after a compound select applies to the whole result.
+        return f"{sql} LIMIT {limit}"
+
+    select = SELECT_RE.search(outer)
+    if select is None:
+        return sql
+    if not UNION_RE.search(outer):
+        if TOP_RE.match(outer, select.end()):
+            return sql
+        return f"{sql[:select.end()]}TOP ({limit}) {sql[select.end():]}"
+
+    # A TOP in one branch only limits that branch. ORDER BY isn't allowed in
+    # a derived table, so it moves to the wrapper; a CTE prefix stays in front.
+    order = list(ORDER_RE.finditer(outer))
+    body, order_by = (sql[:order[-1].start()], " " + sql[order[-1].start():]) if order else (sql, "")
+    prefix, body = body[:select.start()], body[select.start():].rstrip()
+    return f"{prefix}SELECT TOP ({limit}) * FROM ({body}) AS capped{order_by}"
+
+
+def _mssql_estimate(conn, sql):
+    conn.exec_driver_sql("SET SHOWPLAN_XML ON")
+    try:
+        plan = conn.exec_driver_sql(sql).scalar()
+    finally:
+        conn.exec_driver_sql("SET SHOWPLAN_XML OFF")
+    cost = COST_RE.search(plan or "")
+    rows = ROWS_RE.search(plan or "")
+    return (float(cost.group(1)) if cost else 0.0,
+            float(rows.group(1)) if rows else 0.0)
+
+
+def _sqlite_row_count(conn, table):
+    count = table_rows.get(table)
+    if count is None:
+        count = conn.exec_driver_sql(f'SELECT COUNT(*) FROM "{table}"').scalar()
+        table_rows.set(table, count)
+    return count
+
+
+def _sqlite_estimate(conn, sql):
+    # The plan names aliases ("SCAN a"), so map them back to tables.
+    tables = {}
+    for table, alias in ALIAS_RE.findall(sql):
+        tables[table.lower()] = table.split(".")[-1]
+        if alias:
+            tables[alias.lower()] = table.split(".")[-1]
+
+    plan = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    cost = 1.0
+    for row in plan:
+        match = SCAN_RE.match(str(row[-1]))
+        if match:
+            name = match.group(1).lower()
+            table = tables.get(name) or tables.get(name.split(".")[-1])
+            if table:
+                cost *= max(_sqlite_row_count(conn, table), 1)
+    return cost, cost
+
+
+def estimate_cost(conn, sql):
+    """Return (estimated cost, estimated rows) for `sql` without running it."""
+    if conn.dialect.name == "mssql":
+        return _mssql_estimate(conn, sql)
+    if conn.dialect.name == "sqlite":
+        return _sqlite_estimate(conn, sql)
+    return 0.0, 0.0
+
+
+def guard_query(conn, sql, limit, max_cost, max_rows):
+    """Return the (possibly rewritten) SQL to run, or raise QueryRejected."""
+    sql = strip_comments(sql)
+    if max_cost or max_rows:
+        # Estimated as written: under the cap SQL Server would report at
+        # most `limit` rows however large the underlying join is.
+        cost, rows = estimate_cost(conn, sql)
+        if max_cost and cost > max_cost:
+            raise QueryRejected(f"estimated cost {cost:g} exceeds limit {max_cost:g}")
+        if max_rows and rows > max_rows:
+            raise QueryRejected(f"estimated {rows:g} rows exceeds limit {max_rows:g}")
+    return add_row_limit(sql, limit, conn.dialect.name)
+
+
+def install_timeout(engine, seconds):
+    """Bound every statement on `engine` to `seconds`."""
+    if not seconds:
+        return
+
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "before_cursor_execute")
+        def _deadline(conn, cursor, statement, parameters, context, executemany):
+            deadline = time.monotonic() + seconds
+            # Returning true from the handler aborts the running statement.
+            conn.connection.dbapi_connection.set_progress_handler(
+                lambda: time.monotonic() > deadline, 10000
+            )
+    else:
+        @event.listens_for(engine, "connect")
+        def _timeout(dbapi_connection, connection_record):
+            # pyodbc: query timeout in seconds for every statement on this connection.
+            dbapi_connection.timeout = int(seconds)
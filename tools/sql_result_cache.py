@@ -0,0 +1,145 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+'''
+ Result-set cache for sql_tool, keyed on canonicalized SQL text.
+ Results are kept as DataFrames (columnar numpy blocks) rather than
+ per-row dicts, memory is bounded in bytes, each table can have its own
+ TTL, and an entry is dropped as soon as the watermark (rowversion /
+ change-tracking version) of any table it reads from moves.
+ '''
+# A table reference after FROM/JOIN: one to three dotted parts, each a plain,
+# [bracketed] or "quoted" identifier (db.dbo.T, [dbo].[Sales Data], ...).
+NAME_PART = r'(?:\[[^\]]+\]|"[^"]+"|\w+)'
+TABLE_RE = re.compile(rf"\b(?:from|join)\s+({NAME_PART}(?:\s*\.\s*{NAME_PART}){{0,2}})", re.IGNORECASE)
+PART_RE = re.compile(NAME_PART)
+
+
+def canonicalize_sql(sql: str) -> str:
+    # Collapse whitespace outside string literals; literals stay untouched.
+    parts = re.split(r"('(?:[^']|'')*')", sql.strip().rstrip(";"))
+    return "".join(
+        p if i % 2 else re.sub(r"\s+", " ", p).lower()
+        for i, p in enumerate(parts)
+    ).strip()
+
+
+def referenced_tables(sql: str) -> set:
+    # The last part of a qualified name is the table.
+    return {PART_RE.findall(name)[-1].strip('[]"').lower() for name in TABLE_RE.findall(sql)}
+
+
+def parse_table_map(value: str, cast=str) -> dict:
+    # "Sales=60,Customers=600" -> {"sales": 60, "customers": 600}
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {k.strip().lower(): cast(v.strip()) for k, v in pairs}
+
+
+class SQLResultCache:
+    def __init__(self, max_bytes, default_ttl, table_ttls=None,
+                 watermark=None, watermark_interval=5.0):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.table_ttls = {k.lower(): v for k, v in (table_ttls or {}).items()}
+        self.watermark = watermark
+        self.watermark_interval = watermark_interval
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._data = OrderedDict()
+        self._marks = {}
+        self._lock = threading.Lock()
+
+    def _ttl(self, tables):
+        ttls = [self.table_ttls.get(t, self.default_ttl) for t in tables]
+        return min(ttls) if ttls else self.default_ttl
+
+    def _current_mark(self, table):
+        # Watermark lookups are themselves cached for watermark_interval
+        # seconds so a burst of hits costs at most one probe per table.
+        now = time.monotonic()
+        cached = self._marks.get(table)
+        if cached and cached[1] > now:
+            return cached[0]
+        try:
+            mark = self.watermark(table)
+        except Exception as e:
+            print(f"Watermark error for {table}: {e}")
+            mark = None
+        self._marks[table] = (mark, now + self.watermark_interval)
+        return mark
+
+    def _marks_for(self, tables):
+        if self.watermark is None:
+            return {}
+        return {t: self._current_mark(t) for t in tables}
+
+    def marks(self, sql):
+        """Watermarks of the tables `sql` reads; take them before running it."""
+        return self._marks_for(referenced_tables(canonicalize_sql(sql)))
+
+    def get(self, sql):
+        key = canonicalize_sql(sql)
+        with self._lock:
+            item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        df, expires, marks, size = item
+        if expires < time.monotonic() or self._marks_for(marks) != marks:
+            with self._lock:
+                if self._data.get(key) is item:
+                    del self._data[key]
+                    self.bytes -= size
+            self.invalidations += 1
+            self.misses += 1
+            return None
+
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+        self.hits += 1
+        # Callers mutate frames (e.g. date parsing for charts), so hand out a copy.
+        return df.copy()
+
+    def put(self, sql, df, marks=None):
+        """Cache `df` under the watermarks from `marks(sql)` taken before the query ran.
+
+        Marks sampled afterwards could already include a write the result
+        doesn't reflect, and that stale result would then pass as current.
+        """
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+
+        key = canonicalize_sql(sql)
+        tables = referenced_tables(key)
+        if marks is None:
+            marks = self._marks_for(tables)
+        item = (df.copy(), time.monotonic() + self._ttl(tables), marks, size)
+
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[3]
+            self._data[key] = item
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= evicted[3]
+                self.evictions += 1
+
+    def stats(self):
+        return {
+            "entries": len(self._data),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
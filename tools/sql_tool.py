@@ -1,35 +1,66 @@
-import json
-import io
-import base64
+import asyncio
+import hashlib
 import re
-from langchain_openai import AzureChatOpenAI
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 import pandas as pd
-from sqlalchemy import text, create_engine
+from sqlalchemy import event, text, create_engine
 import os
 from langchain_core.tools import Tool
+from utils.limits import limit, run_limited
+from utils.singleflight import coalesce
+from utils.tracing import observe_payload, span, tool_failed
+from utils.clients import Lazy, get_llm
+from utils.tokens import read_token, sign_token
+from utils.fastjson import dumps_text
+from tools.sql_cache import SQLPlanCache
+from tools.charts import build_chart, is_chart_request
+from tools.sql_result_cache import SQLResultCache, parse_table_map
+from tools.sql_guard import guard_query, install_timeout
+from tools.schema_catalog import SchemaCatalog
 
-llm = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-    api_version="2024-02-01",
-    temperature=0
-)
 
-engine = create_engine(
-    f"mssql+pyodbc://@{os.getenv('SQL_SERVER')}/{os.getenv('SQL_DATABASE')}"
-    "?driver=ODBC+Driver+17+for+SQL+Server"
-    "&trusted_connection=yes"
-)
+QUERY_TIMEOUT = float(os.getenv("SQL_QUERY_TIMEOUT", "30"))
+# Plan cost units mean different things per engine and server, so there is
+# no safe default; estimated rows are comparable and catch runaway joins.
+MAX_COST = float(os.getenv("SQL_MAX_COST", "0"))
+MAX_EST_ROWS = float(os.getenv("SQL_MAX_EST_ROWS", "100000000"))
+
+
+def create_sql_engine():
+    # SQL_URL points the tool at another database, e.g. a local SQLite
+    # copy of the schema for tests and benchmarks.
+    url = os.getenv("SQL_URL")
+    if url:
+        engine = create_engine(url, pool_pre_ping=True)
+    else:
+        engine = create_engine(
+            f"mssql+pyodbc://@{os.getenv('SQL_SERVER')}/{os.getenv('SQL_DATABASE')}"
+            "?driver=ODBC+Driver+17+for+SQL+Server"
+            "&trusted_connection=yes",
+            pool_pre_ping=True
+        )
+
+    if engine.dialect.name == "sqlite" and engine.url.database:
+        # Generated SQL always says dbo.Table; make that resolve in SQLite.
+        @event.listens_for(engine, "connect")
+        def _attach_dbo(dbapi_connection, connection_record):
+            dbapi_connection.execute("ATTACH DATABASE ? AS dbo", (engine.url.database,))
+
+    install_timeout(engine, QUERY_TIMEOUT)
+    return engine
 
-# print(" Generated SQL:", query)
 
-with engine.connect() as conn:
-    db = conn.execute(text("SELECT DB_NAME()")).scalar()
-    print("CONNECTED DATABASE:", db)
+# Built on first use so importing this module never touches SQL Server.
+engine = Lazy(create_sql_engine)
+
+
+def warmup():
+    with engine.get().connect() as conn:
+        if conn.dialect.name == "mssql":
+            db = conn.execute(text("SELECT DB_NAME()")).scalar()
+        else:
+            db = conn.engine.url.database
+        print("CONNECTED DATABASE:", db)
+    return db
 
 
 def extract_sql(text_response: str) -> str | None:
@@ -41,8 +72,47 @@ def extract_sql(text_response: str) -> str | None:
     return match.group(1).strip() if match else None
 
 
-def sql_tool_func(question: str):
-    sql_prompt = f"""
+# Used when the database can't be introspected.
+FALLBACK_SCHEMA = """Sales(
+  SaleID,
+  ProductName,
+  Quantity,
+  UnitPrice,
+  SaleDate,
+  CustomerName
+)"""
+
+
+catalog = SchemaCatalog(
+    engine,
+    schema=os.getenv("SQL_SCHEMA") or ("dbo" if not os.getenv("SQL_URL") else None),
+    refresh_interval=float(os.getenv("SCHEMA_REFRESH_INTERVAL", "3600")),
+    max_tables=int(os.getenv("SCHEMA_MAX_TABLES", "4")),
+    max_columns=int(os.getenv("SCHEMA_MAX_COLUMNS", "12")),
+    match=os.getenv("SCHEMA_MATCH", "keyword"),
+    retry_interval=float(os.getenv("SCHEMA_RETRY_INTERVAL", "30"))
+)
+
+
+def load_schema():
+    # Introspect (or re-check) the schema so prompt_version() is current.
+    try:
+        catalog.ensure_loaded()
+    except Exception as e:
+        print(f"Schema introspection error: {e}")
+
+
+def schema_for(question: str) -> str:
+    try:
+        # Empty while the database can't be introspected.
+        return catalog.render(question) or FALLBACK_SCHEMA
+    except Exception as e:
+        print(f"Schema introspection error: {e}")
+        return FALLBACK_SCHEMA
+
+
+def build_sql_prompt(question: str, schema: str = FALLBACK_SCHEMA) -> str:
+    return f"""
 You are a senior SQL Server analyst.
 
 Task:
@@ -51,14 +121,7 @@ Do NOT provide explanations, notes, or commentary.
 Do NOT use markdown formatting or backticks.
 
 Schema:
-Sales(
-  SaleID,
-  ProductName,
-  Quantity,
-  UnitPrice,
-  SaleDate,
-  CustomerName
-)
+{schema}
 
 Rules:
 Note:If the user asks for graph, chart, bar graph, visualization, or sales count,
@@ -81,96 +144,218 @@ IMPORTANT SQL RULES:
 13. If the question is ambiguous, choose the simplest valid interpretation that matches the schema.
 14. If the question cannot be answered with the provided schema, output a query that returns zero rows, using a safe condition like WHERE 1=0.
 
+User question:
+{question}
 """
 
-    llm_response = llm.invoke(sql_prompt).content
-    sql = extract_sql(llm_response)
 
+PROMPT_HASH = hashlib.sha1(build_sql_prompt("", "").encode("utf-8")).hexdigest()
+
+
+def prompt_version() -> str:
+    # Cached SQL is only valid for the prompt and schema it was generated with.
+    return hashlib.sha1(f"{PROMPT_HASH}:{catalog.fingerprint}".encode("utf-8")).hexdigest()
+
+
+# Versioned by generate_sql on each lookup; the file is opened on first use.
+plan_cache = SQLPlanCache(
+    path=os.getenv("SQL_PLAN_CACHE_PATH", "cache/sql_plans.db"),
+    maxsize=int(os.getenv("SQL_PLAN_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("SQL_PLAN_CACHE_TTL", "86400")) or None,
+    threshold=float(os.getenv("SQL_PLAN_CACHE_SIMILARITY", "0.97"))
+)
+
+
+def is_valid_sql(sql) -> bool:
+    return bool(sql) and sql.lower().startswith("select")
+
+
+def generate_sql(question: str):
+    with span("sql_schema", "sql"):
+        load_schema()
+    plan_cache.set_version(prompt_version())
+    with span("sql_plan_cache", "cache"):
+        sql = plan_cache.get(question)
+    if sql is None:
+        # Rendering may embed the question, so only cache misses pay for it.
+        with span("sql_schema", "sql"):
+            schema = schema_for(question)
+        with span("sql_generate", "azure_openai"):
+            sql = extract_sql(get_llm().invoke(build_sql_prompt(question, schema)).content)
+        if is_valid_sql(sql):
+            plan_cache.put(question, sql)
+    return sql
+
+
+async def agenerate_sql(question: str):
+    with span("sql_schema", "sql"):
+        await asyncio.to_thread(load_schema)
+    plan_cache.set_version(prompt_version())
+    with span("sql_plan_cache", "cache"):
+        sql = await asyncio.to_thread(plan_cache.get, question)
+    if sql is None:
+        with span("sql_schema", "sql"):
+            schema = await asyncio.to_thread(schema_for, question)
+        async with limit("llm"):
+            with span("sql_generate", "azure_openai"):
+                llm_response = (await get_llm().ainvoke(build_sql_prompt(question, schema))).content
+        sql = extract_sql(llm_response)
+        if is_valid_sql(sql):
+            await asyncio.to_thread(plan_cache.put, question, sql)
+    return sql
+
+
+# Per-table rowversion columns, e.g. "Sales=RowVer". Tables without one fall
+# back to the database change-tracking version, so any tracked change
+# invalidates their cached results.
+ROWVERSION_COLUMNS = parse_table_map(os.getenv("SQL_ROWVERSION_COLUMNS", ""))
+
+
+def table_watermark(table: str):
+    if engine.get().dialect.name != "mssql":
+        return None
+    column = ROWVERSION_COLUMNS.get(table)
+    if column:
+        query = f"SELECT MAX([{column}]) FROM dbo.[{table}]"
+    else:
+        query = "SELECT CHANGE_TRACKING_CURRENT_VERSION()"
+    with engine.get().connect() as conn:
+        return conn.execute(text(query)).scalar()
+
+
+result_cache = SQLResultCache(
+    max_bytes=int(os.getenv("SQL_RESULT_CACHE_BYTES", str(256 * 1024 * 1024))),
+    default_ttl=float(os.getenv("SQL_RESULT_TTL", "60")),
+    table_ttls=parse_table_map(os.getenv("SQL_RESULT_TABLE_TTLS", ""), float),
+    watermark=table_watermark,
+    watermark_interval=float(os.getenv("SQL_WATERMARK_INTERVAL", "5"))
+)
+
+
+PAGE_SIZE = int(os.getenv("SQL_PAGE_SIZE", "100"))
+MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "10000"))
+FETCH_SIZE = int(os.getenv("SQL_FETCH_SIZE", "1000"))
+
+
+def read_sql_capped(sql: str):
+    """Stream the result through a server-side cursor, stopping at MAX_ROWS."""
+    chunks = []
+    rows = 0
+    with engine.get().connect().execution_options(stream_results=True) as conn:
+        # One row past the cap tells us whether the result was cut short.
+        with span("sql_guard", "sql"):
+            sql = guard_query(conn, sql, MAX_ROWS + 1, MAX_COST, MAX_EST_ROWS)
+        with span("sql_read", "sql"):
+            for chunk in pd.read_sql(text(sql), conn, chunksize=FETCH_SIZE):
+                chunks.append(chunk)
+                rows += len(chunk)
+                if rows > MAX_ROWS:
+                    break
+
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+    truncated = len(df) > MAX_ROWS
+    df = df.iloc[:MAX_ROWS]
+    df.attrs["truncated"] = truncated
+    observe_payload("sql_result", int(df.memory_usage(index=True, deep=True).sum()))
+    return df
+
+
+def read_sql_cached(sql: str):
+    with span("sql_result_cache", "cache"):
+        df = result_cache.get(sql)
+    if df is None:
+        marks = result_cache.marks(sql)
+        df = read_sql_capped(sql)
+        result_cache.put(sql, df, marks)
+    return df
+
+
+def table_page(sql: str, df, offset: int = 0) -> dict:
+    page = df.iloc[offset:offset + PAGE_SIZE]
+    end = offset + len(page)
+    # Columns once plus row arrays; NaN/NaT become null.
+    return {
+        "type": "sql_result",
+        "columns": [str(c) for c in page.columns],
+        "rows": page.astype(object).where(page.notna(), None).values.tolist(),
+        "offset": offset,
+        "total": len(df),
+        "truncated": bool(df.attrs.get("truncated")),
+        "next": sign_token({"sql": sql, "offset": end}) if end < len(df) else None,
+    }
+
+
+def sql_page(token: str) -> dict:
+    """Serve a later page of a table result; raises ValueError on a bad token."""
+    payload = read_token(token)
+    sql = payload["sql"]
+    if not is_valid_sql(sql):
+        raise ValueError("invalid token")
+    df = read_sql_cached(sql)
+    return table_page(sql, df, int(payload["offset"]))
+
+
+@coalesce("sql")
+def sql_result(question: str):
+    return execute_sql(question, generate_sql(question))
+
+
+@coalesce("sql")
+async def sql_aresult(question: str):
+    sql = await agenerate_sql(question)
+    return await run_limited("sql", execute_sql, question, sql)
+
+
+def checked(result):
+    # Results are dicts; a string is an error. Marked per caller, so
+    # requests coalesced onto a failed query skip the answer cache too.
+    if isinstance(result, str):
+        tool_failed("sql")
+    return result
+
+
+def sql_tool_result(question: str):
+    """Structured result (dict) or an error string; used by the direct path."""
+    return checked(sql_result(question))
+
+
+async def sql_tool_aresult(question: str):
+    return checked(await sql_aresult(question))
+
+
+def as_tool_output(result) -> str:
+    return result if isinstance(result, str) else dumps_text(result)
+
+
+def sql_tool_func(question: str):
+    return as_tool_output(sql_tool_result(question))
+
+
+async def sql_tool_afunc(question: str):
+    return as_tool_output(await sql_tool_aresult(question))
+
+
+def execute_sql(question: str, sql):
     print("SQL:", sql)
 
-    if not sql or not sql.lower().startswith("select"):
+    if not is_valid_sql(sql):
         return "Invalid SQL generated."
 
     try:
-        df = pd.read_sql(text(sql), engine)
+        df = read_sql_cached(sql)
 
         if df.empty:
-            return json.dumps({
+            return {
                 "type": "sql_result",
-                "data": []
-            })
+                "columns": [str(c) for c in df.columns],
+                "rows": []
+            }
 
         # Check if the question is about graph/visualization
-        if any(k in question.lower() for k in ["graph", "chart", "visual", "plot"]):
-            # Determine graph type
-            graph_type = "auto"
-            if "bar" in question.lower():
-                graph_type = "bar"
-            elif "pie" in question.lower():
-                graph_type = "pie"
-            elif "line" in question.lower():
-                graph_type = "line"
-            elif "scatter" in question.lower():
-                graph_type = "scatter"
-
-            # Generate graph
-            plt.figure(figsize=(10, 6))
-
-            # Convert date columns to datetime if present
-            for col in df.columns:
-                if 'date' in col.lower() or pd.api.types.is_datetime64_any_dtype(df[col]):
-                    df[col] = pd.to_datetime(df[col])
-
-            if graph_type == "pie" and len(df.columns) >= 2:
-                # Pie chart: assume first column labels, second values
-                plt.pie(df.iloc[:, 1], labels=df.iloc[:, 0], autopct='%1.1f%%')
-                plt.title('Pie Chart')
-            elif graph_type == "bar" or (graph_type == "auto" and len(df.columns) >= 2 and (df.dtypes.iloc[0] in ['object', 'string'] or df.dtypes.iloc[0] == 'category') and df.dtypes.iloc[1] in ['int64', 'float64']):
-                # Bar chart
-                plt.bar(df.iloc[:, 0], df.iloc[:, 1])
-                plt.title('Bar Chart')
-                plt.xlabel(df.columns[0])
-                plt.ylabel(df.columns[1])
-                plt.xticks(rotation=45)
-            elif graph_type == "line" or (graph_type == "auto" and len(df.columns) >= 2 and (pd.api.types.is_datetime64_any_dtype(df.iloc[:, 0]) or 'date' in df.columns[0].lower()) and df.dtypes.iloc[1] in ['int64', 'float64']):
-                # Line chart for time series
-                df = df.sort_values(df.columns[0])
-                plt.plot(df.iloc[:, 0], df.iloc[:, 1], marker='o')
-                plt.title('Line Chart')
-                plt.xlabel(df.columns[0])
-                plt.ylabel(df.columns[1])
-                plt.xticks(rotation=45)
-                plt.grid(True)
-            elif graph_type == "scatter" or (graph_type == "auto" and len(df.columns) >= 2 and df.dtypes.iloc[0] in ['int64', 'float64'] and df.dtypes.iloc[1] in ['int64', 'float64']):
-                # Scatter plot
-                plt.scatter(df.iloc[:, 0], df.iloc[:, 1])
-                plt.title('Scatter Plot')
-                plt.xlabel(df.columns[0])
-                plt.ylabel(df.columns[1])
-            else:
-                # Default: bar chart
-                if len(df.columns) >= 2:
-                    df.plot(kind='bar', x=df.columns[0], y=df.columns[1], ax=plt.gca())
-                else:
-                    df.plot(kind='bar', ax=plt.gca())
-                plt.title('Data Visualization')
-                plt.xticks(rotation=45)
-            
-            buf = io.BytesIO()
-            plt.savefig(buf, format='png')
-            buf.seek(0)
-            image_base64 = base64.b64encode(buf.read()).decode('utf-8')
-            plt.close()
-            
-            return json.dumps({
-                "type": "image",
-                "data": image_base64
-            })
+        if is_chart_request(question):
+            return build_chart(df, question)
         else:
-            return json.dumps({
-                "type": "sql_result",
-                "data": df.to_dict(orient="records"),
-            })
+            return table_page(sql, df)
 
     except Exception as e:
         return f"SQL Error: {str(e)}"
@@ -179,5 +364,6 @@ IMPORTANT SQL RULES:
 sql_tool = Tool(
     name="SQLSearch",
     func=sql_tool_func,
+    coroutine=sql_tool_afunc,
     description="Use this tool for any database queries related to RechargePlans, Customers, Recharges."
 )
\ No newline at end of file
@@ -1,30 +1,39 @@
 from langchain_core.tools import Tool
-from langchain_openai import AzureChatOpenAI
-import os
-
-llm = AzureChatOpenAI(
-    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
-    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-    deployment_name=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-    api_version="2024-02-01",
-    temperature=0
-)   
-def travel_agent(question: str):
-    prompt = f"""
+from utils.limits import limit
+from utils.clients import get_llm
+from utils.singleflight import coalesce
+from utils.tracing import span
+
+
+def build_travel_prompt(question: str) -> str:
+    return f"""
 You are a professional travel agent.
 
 User: {question}
 """
-    return llm.invoke(prompt).content
+
+
+@coalesce("travel")
+def travel_agent(question: str):
+    with span("travel_generate", "azure_openai"):
+        return get_llm().invoke(build_travel_prompt(question)).content
 
 
 def travel_tool_func(question: str):
     return travel_agent(question)
 
 
+@coalesce("travel")
+async def travel_tool_afunc(question: str):
+    async with limit("llm"):
+        with span("travel_generate", "azure_openai"):
+            return (await get_llm().ainvoke(build_travel_prompt(question))).content
+
+
 travel_tool = Tool(
     name="TravelAgent",
     func=travel_tool_func,
+    coroutine=travel_tool_afunc,
    
 description = (
     "IMPORTANT: If the user asks about a trip or destination without sufficient details "
@@ -0,0 +1,189 @@
+import contextvars
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from utils.cache import TTLCache
+from utils.clean_text import normalize_query
+from utils.ratelimit import TokenBucket
+from utils.tracing import span
+
+'''
+ Web search layer for InternetSearch and the policy fallback. Results are
+ cached per normalized query, DDGS sessions are reused (one per thread),
+ and every provider call goes through one process-wide rate limiter.
+ With SEARCH_EXPANSIONS > 1 a question is also searched in reformulated
+ forms, concurrently, and the merged results are de-duplicated by URL.
+
+ SEARCH_BACKEND=fake swaps the provider for a local fake (canned results
+ from SEARCH_FAKE_PATH, or synthetic ones) with configurable latency, for
+ tests and benchmarks.
+ '''
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "ddgs")
+EXPANSIONS = int(os.getenv("SEARCH_EXPANSIONS", "1"))
+
+STOPWORDS = {
+    "a", "an", "and", "are", "can", "do", "does", "for", "how", "i", "in", "is", "it", "me",
+    "of", "on", "or", "please", "tell", "the", "to", "what", "when", "where", "which", "who",
+    "why", "with", "you",
+}
+TRACKING_PARAMS = re.compile(r"^(utm_\w+|fbclid|gclid|ref)$")
+
+
+class DDGSBackend:
+    def __init__(self):
+        self._local = threading.local()
+
+    def session(self):
+        # DDGS keeps an HTTP client with its connection pool; reuse it per thread.
+        ddgs = getattr(self._local, "ddgs", None)
+        if ddgs is None:
+            from ddgs import DDGS
+            ddgs = self._local.ddgs = DDGS()
+        return ddgs
+
+    def text(self, query, max_results):
+        return self.session().text(query, max_results=max_results)
+
+
+class FakeSearchBackend:
+    """Canned or synthetic results with simulated provider latency."""
+
+    def __init__(self, path=None, latency=0.0, jitter=0.5):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+        self.canned = {}
+        if path:
+            with open(path, encoding="utf-8") as f:
+                self.canned = {normalize_query(k): v for k, v in json.load(f).items()}
+
+    def text(self, query, max_results):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        key = normalize_query(query)
+        if key in self.canned:
+            return self.canned[key][:max_results]
+        slug = hashlib.sha1(key.encode("utf-8")).hexdigest()[:8]
+        return [
+            {"title": f"{query} ({i + 1})", "href": f"https://example.com/{slug}/{i}", "body": f"Result {i + 1} for {query}."}
+            for i in range(max_results)
+        ]
+
+
+def create_backend(name):
+    if name == "fake":
+        return FakeSearchBackend(
+            path=os.getenv("SEARCH_FAKE_PATH"),
+            latency=float(os.getenv("SEARCH_FAKE_LATENCY_MS", "0")) / 1000
+        )
+    if name == "ddgs":
+        return DDGSBackend()
+    raise ValueError(f"Unknown SEARCH_BACKEND: {name}")
+
+
+def canonical_url(url: str) -> str:
+    parts = urlsplit(url.strip())
+    host = parts.netloc.lower().removeprefix("www.")
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not TRACKING_PARAMS.match(k)])
+    return urlunsplit(("", host, parts.path.rstrip("/"), query, ""))
+
+
+def expand_query(query: str, n: int) -> list:
+    """Up to n distinct phrasings: the query itself, then keyword forms."""
+    words = re.findall(r"\w+", query.lower())
+    keywords = " ".join(w for w in words if w not in STOPWORDS)
+    candidates = [query, keywords, f"{keywords} overview", f"\"{keywords}\""]
+    variants = []
+    for q in candidates:
+        if q.strip('" ') and normalize_query(q) not in {normalize_query(v) for v in variants}:
+            variants.append(q)
+    return variants[:max(n, 1)]
+
+
+class WebSearch:
+    def __init__(self, backend, rate, max_workers=8, cache_size=2048, ttl=900):
+        self.backend = backend
+        self.limiter = TokenBucket(rate)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="web-search")
+        self.cache = TTLCache(maxsize=cache_size, ttl=ttl)
+        self.provider_calls = 0
+        self.errors = 0
+
+    def _query(self, query, max_results):
+        key = ("q", normalize_query(query), max_results)
+        results = self.cache.get(key)
+        if results is None:
+            with span("search_rate_limit", SEARCH_BACKEND):
+                self.limiter.acquire()
+            self.provider_calls += 1
+            with span("search_provider", SEARCH_BACKEND):
+                results = list(self.backend.text(query, max_results) or [])
+            if results:
+                self.cache.set(key, results)
+        return results
+
+    def search(self, query, max_results=5, expansions=EXPANSIONS):
+        """Return up to max_results {title, href, body} dicts for `query`."""
+        key = ("s", normalize_query(query), max_results, expansions)
+        results = self.cache.get(key)
+        if results is not None:
+            return [dict(r) for r in results]
+
+        variants = expand_query(query, expansions)
+        if len(variants) == 1:
+            batches = [self._query(query, max_results)]
+        else:
+            futures = [
+                self.executor.submit(contextvars.copy_context().run, self._query, q, max_results)
+                for q in variants
+            ]
+            batches, error = [], None
+            for future in futures:
+                try:
+                    batches.append(future.result())
+                except Exception as e:
+                    self.errors += 1
+                    error = e
+            if not batches and error is not None:
+                raise error
+
+        # Interleave the variants' rankings, original query first.
+        merged, seen = [], set()
+        for rank in range(max((len(b) for b in batches), default=0)):
+            for batch in batches:
+                if rank < len(batch):
+                    url = canonical_url(batch[rank].get("href") or "")
+                    if url and url in seen:
+                        continue
+                    seen.add(url)
+                    merged.append(batch[rank])
+        merged = merged[:max_results]
+        if merged:
+            self.cache.set(key, merged)
+        return [dict(r) for r in merged]
+
+    def stats(self):
+        return {
+            "backend": SEARCH_BACKEND,
+            "cache": self.cache.stats(),
+            "provider_calls": self.provider_calls,
+            "errors": self.errors,
+            "rate_limiter": self.limiter.stats(),
+        }
+
+
+web_search = WebSearch(
+    create_backend(SEARCH_BACKEND),
+    rate=float(os.getenv("SEARCH_RATE_PER_SEC", "2")),
+    max_workers=int(os.getenv("SEARCH_WORKERS", "8")),
+    cache_size=int(os.getenv("SEARCH_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("SEARCH_CACHE_TTL", "900"))
+)
@@ -0,0 +1,153 @@
+import os
+import re
+import threading
+from collections import Counter
+
+from utils.cache import TTLCache
+from utils.clean_text import normalize_query
+from utils.embeddings import VectorIndex, get_embedder
+from utils.tracing import failed_tools
+
+'''
+ Whole-answer cache in front of the agents, scoped by intent. A question
+ is answered from the cache when its normalized text matches an earlier
+ one exactly or, for intents in ANSWER_CACHE_SEMANTIC_INTENTS, when its
+ embedding is close enough to an earlier question's. A hit skips routing
+ to the agent, every LLM call and the tools.
+
+ Only questions that stand on their own are cached: follow-ups that lean
+ on the conversation ("what about last year?", "show that as a chart")
+ and personal questions ("my leave balance") always run the pipeline.
+ Answers from a turn in which a tool failed (see tracing.tool_failed) are
+ never stored, however the agent worded them.
+ '''
+FOLLOW_UP_RE = re.compile(
+    r"^\s*(and|also|what about|how about|same|then|so)\b"
+    r"|\b(it|its|that|those|these|this|them|they|above|previous|earlier|again|instead)\b",
+    re.IGNORECASE
+)
+PERSONAL_RE = re.compile(r"\b(i|me|my|mine|our|ours|we)\b", re.IGNORECASE)
+NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+
+def parse_intent_map(value: str, cast=float) -> dict:
+    # "policy=3600,sql=60" -> {"policy": 3600.0, "sql": 60.0}
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {k.strip(): cast(v) for k, v in pairs}
+
+
+def parse_intents(value: str) -> set:
+    return {i.strip() for i in value.split(",") if i.strip()}
+
+
+class AnswerCache:
+    def __init__(self, intents, ttls, default_ttl=600, semantic_intents=(),
+                 threshold=0.95, maxsize=4096):
+        self.intents = set(intents)
+        self.ttls = ttls
+        self.default_ttl = default_ttl
+        self.semantic_intents = set(semantic_intents)
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.entries = TTLCache(maxsize=maxsize)
+        self.indexes = {}
+        self.vectors = TTLCache(maxsize=1024, ttl=default_ttl)
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def cacheable(self, intent, query, history=None):
+        if intent not in self.intents or PERSONAL_RE.search(query):
+            return False
+        # Without earlier turns there is nothing for a follow-up to refer to.
+        return not (history is not None and history.messages and FOLLOW_UP_RE.search(query))
+
+    def _vector(self, query):
+        if not self.semantic_intents:
+            return None
+        embed = get_embedder()
+        if embed is None:
+            return None
+        key = normalize_query(query)
+        vector = self.vectors.get(key)
+        if vector is None:
+            vector = embed(query)
+            self.vectors.set(key, vector)
+        return vector
+
+    def get(self, intent, query, history=None):
+        """Return the cached answer for this question, or None."""
+        if not self.cacheable(intent, query, history):
+            self.counts[f"{intent}:bypass"] += 1
+            return None
+
+        key = (intent, normalize_query(query))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.counts[f"{intent}:exact"] += 1
+            return entry[1]
+
+        index = self.indexes.get(intent)
+        if intent in self.semantic_intents and index is not None:
+            vector = self._vector(query)
+            if vector is not None:
+                match, _ = index.search(vector, self.threshold)
+                entry = self.entries.get(match) if match else None
+                if match and entry is None:
+                    index.remove(match)
+                # "sales in 2023" and "sales in 2024" embed almost identically.
+                elif entry is not None and NUMBER_RE.findall(entry[0]) == NUMBER_RE.findall(query):
+                    self.counts[f"{intent}:semantic"] += 1
+                    return entry[1]
+
+        self.counts[f"{intent}:miss"] += 1
+        return None
+
+    def put(self, intent, query, answer, history=None):
+        if not self.cacheable(intent, query, history):
+            return
+        if isinstance(answer, str) and not answer.strip():
+            return
+        if failed_tools():
+            self.counts[f"{intent}:failed"] += 1
+            return
+
+        key = (intent, normalize_query(query))
+        self.entries.set(key, (query, answer), ttl=self.ttls.get(intent, self.default_ttl))
+        if intent not in self.semantic_intents:
+            return
+        vector = self._vector(query)
+        if vector is None:
+            return
+        with self._lock:
+            index = self.indexes.setdefault(intent, VectorIndex())
+            index.remove(key)
+            index.add(key, vector)
+            if len(index.keys) > self.maxsize:
+                # Drop index entries whose answers expired or were evicted.
+                for stale in [k for k in index.keys if self.entries.get(k) is None]:
+                    index.remove(stale)
+
+    def stats(self):
+        stats = {"entries": len(self.entries)}
+        for intent in sorted(self.intents):
+            exact, semantic = self.counts[f"{intent}:exact"], self.counts[f"{intent}:semantic"]
+            misses = self.counts[f"{intent}:miss"]
+            lookups = exact + semantic + misses
+            stats[intent] = {
+                "exact_hits": exact,
+                "semantic_hits": semantic,
+                "misses": misses,
+                "bypassed": self.counts[f"{intent}:bypass"],
+                "hit_rate": round((exact + semantic) / lookups, 3) if lookups else 0.0,
+            }
+        return stats
+
+
+answer_cache = AnswerCache(
+    intents=parse_intents(os.getenv("ANSWER_CACHE_INTENTS", "policy,internet,sql")),
+    ttls=parse_intent_map(os.getenv("ANSWER_CACHE_TTLS", "policy=3600,internet=900,sql=60")),
+    default_ttl=float(os.getenv("ANSWER_CACHE_TTL", "600")),
+    semantic_intents=parse_intents(os.getenv("ANSWER_CACHE_SEMANTIC_INTENTS", "policy,internet")),
+    threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95")),
+    maxsize=int(os.getenv("ANSWER_CACHE_SIZE", "4096"))
+)
@@ -0,0 +1,66 @@
+import os
+from typing import NamedTuple
+
+from utils.answer_cache import parse_intent_map
+from utils.clean_text import normalize_query
+from utils.fastjson import dumps
+
+'''
+ Planning for POST /ask/batch. Items are routed up front, identical
+ questions are folded into one job, and each intent gets its own
+ concurrency bound, so a batch keeps every backend busy without
+ overrunning any one of them.
+ '''
+MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "10000"))
+DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY_DEFAULT", "4"))
+CONCURRENCY = parse_intent_map(os.getenv("BATCH_CONCURRENCY", ""), int)
+
+
+class BatchJob(NamedTuple):
+    intent: str
+    query: str
+    memory: object
+    indexes: list
+
+
+def concurrency(intent):
+    return CONCURRENCY.get(intent, DEFAULT_CONCURRENCY)
+
+
+def plan_batch(items, detect_intent, get_memory, uses_history):
+    """Return (jobs, invalid item indexes). Each job answers one or more items.
+
+    Conversations are only loaded for intents where uses_history(intent) is
+    true; other jobs get memory=None. This can touch the memory backend, so
+    async callers should run it in a thread.
+    """
+    jobs, invalid = {}, []
+    for i, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get("query") or "conversation_id" not in item:
+            invalid.append(i)
+            continue
+        query = item["query"]
+        intent = detect_intent(query)
+        memory = get_memory(item["conversation_id"]) if uses_history(intent) else None
+        # A question asked inside an ongoing conversation may depend on it,
+        # so it is only shared with the same question in that conversation.
+        scope = item["conversation_id"] if memory is not None and memory.messages else None
+        key = (intent, normalize_query(query), scope)
+        if key in jobs:
+            jobs[key].indexes.append(i)
+        else:
+            jobs[key] = BatchJob(intent, query, memory, [i])
+    return list(jobs.values()), invalid
+
+
+def batch_line(index, item, intent=None, payload=None, error=None) -> bytes:
+    line = {"index": index}
+    if isinstance(item, dict) and "id" in item:
+        line["id"] = item["id"]
+    if intent is not None:
+        line["intent"] = intent
+    if error is not None:
+        line["error"] = error
+    else:
+        line.update(payload)
+    return dumps(line) + b"\n"
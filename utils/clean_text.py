@@ -5,3 +5,23 @@ import re
 def clean_text(text: str):
     text = re.sub(r"\n{3,}", "\n\n", text)
     return text.strip()
+
+
+def normalize_query(text: str) -> str:
+    # Cache key form: case, whitespace and trailing punctuation don't matter.
+    text = re.sub(r"\s+", " ", text.lower()).strip()
+    return text.rstrip("?.! ")
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text; good enough for budgeting.
+    return len(text) // 4 + 1
+
+
+def stem(word: str) -> str:
+    # Cheap plural folding for keyword matching: "sales" ~ "sale", "policies" ~ "policy".
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
@@ -0,0 +1,92 @@
+import os
+import threading
+
+import httpx
+
+from utils.llm_scheduler import AsyncLLMTransport, LLMTransport, llm_scheduler
+from utils.tracing import LLMMetricsCallback
+
+'''
+ Shared, lazily built clients. Nothing here connects at import time; the
+ first caller (or /warmup) pays the setup cost, and every module reuses
+ the same LLM client and keep-alive connection pool.
+ '''
+
+
+class Lazy:
+    """Thread-safe lazily constructed singleton."""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self.factory()
+        return self._value
+
+    @property
+    def ready(self):
+        return self._value is not None
+
+
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "20"))
+)
+
+# Every Azure OpenAI call goes through the scheduler (utils/llm_scheduler.py).
+http_client = Lazy(lambda: httpx.Client(
+    transport=LLMTransport(llm_scheduler, httpx.HTTPTransport(limits=HTTP_LIMITS)), timeout=60
+))
+http_async_client = Lazy(lambda: httpx.AsyncClient(
+    transport=AsyncLLMTransport(llm_scheduler, httpx.AsyncHTTPTransport(limits=HTTP_LIMITS)), timeout=60
+))
+
+_llms = {}
+_llms_lock = threading.Lock()
+
+
+def get_llm(deployment=None, temperature=0):
+    """Return the shared AzureChatOpenAI client for a deployment/temperature."""
+    deployment = deployment or os.getenv("AZURE_OPENAI_DEPLOYMENT")
+    key = (deployment, temperature)
+    llm = _llms.get(key)
+    if llm is None:
+        with _llms_lock:
+            llm = _llms.get(key)
+            if llm is None:
+                from langchain_openai import AzureChatOpenAI
+
+                llm = _llms[key] = AzureChatOpenAI(
+                    azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+                    api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                    deployment_name=deployment,
+                    api_version="2024-02-01",
+                    temperature=temperature,
+                    max_retries=0,
+                    http_client=http_client.get(),
+                    http_async_client=http_async_client.get(),
+                    callbacks=[LLMMetricsCallback(deployment)]
+                )
+    return llm
+
+
+def create_embeddings():
+    from langchain_openai import AzureOpenAIEmbeddings
+
+    return AzureOpenAIEmbeddings(
+        azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
+        api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+        azure_deployment=os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT"),
+        api_version="2024-02-01",
+        max_retries=0,
+        http_client=http_client.get(),
+        http_async_client=http_async_client.get()
+    )
+
+
+embeddings = Lazy(create_embeddings)
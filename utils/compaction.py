@@ -0,0 +1,99 @@
+import os
+
+from utils.cache import TTLCache
+from utils.clean_text import estimate_tokens
+
+'''
+ Keeps the history sent to an agent under a per-intent token budget.
+ The last few turns go verbatim; older turns are folded into a running
+ summary that is cached per conversation and extended in batches of
+ SUMMARIZE_EVERY aged-out turns, so the prompt stays flat however long a
+ session runs without a summarizer call on every request. Messages the
+ memory window trimmed before they were summarized are folded in first.
+ '''
+KEEP_TURNS = int(os.getenv("HISTORY_KEEP_TURNS", "3"))
+SUMMARIZE_EVERY = int(os.getenv("HISTORY_SUMMARIZE_EVERY", "4"))
+DEFAULT_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "2000"))
+SUMMARY_WORDS = int(os.getenv("HISTORY_SUMMARY_WORDS", "150"))
+
+
+def parse_budgets(value: str) -> dict:
+    # "sql=300,travel=3000" -> {"sql": 300, "travel": 3000}
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {k.strip(): int(v) for k, v in pairs}
+
+
+BUDGETS = parse_budgets(os.getenv("HISTORY_TOKEN_BUDGETS", ""))
+
+
+def llm_summarizer(llm, max_words=SUMMARY_WORDS):
+    def summarize(previous, messages):
+        lines = "\n".join(f"{m.type}: {m.content}" for m in messages)
+        prompt = f"""
+Update the running summary of a conversation with the new messages below.
+Keep facts, names, numbers and open questions the assistant may need later.
+Reply with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{previous or "(empty)"}
+
+New messages:
+{lines}
+"""
+        return llm.invoke(prompt).content.strip()
+    return summarize
+
+
+class HistoryCompactor:
+    def __init__(self, summarize, keep_turns=KEEP_TURNS, default_budget=DEFAULT_BUDGET, budgets=None,
+                 every=SUMMARIZE_EVERY):
+        self.summarize = summarize
+        self.keep_turns = keep_turns
+        self.every = every
+        self.default_budget = default_budget
+        self.budgets = budgets if budgets is not None else BUDGETS
+        # cid -> (absolute index summarized up to, summary text)
+        self.summaries = TTLCache(maxsize=int(os.getenv("MEMORY_MAX_CONVERSATIONS", "10000")))
+        self.summary_calls = 0
+
+    def budget(self, intent):
+        return self.budgets.get(intent, self.default_budget)
+
+    def messages_for(self, history, intent):
+        """Return the compacted message list to send ahead of the new query."""
+        trimmed = list(getattr(history, "trimmed", ()))
+        msgs = trimmed + list(history.messages)
+        base = getattr(history, "offset", 0) - len(trimmed)
+        upto, summary = self.summaries.get(history.cid) or (base, "")
+        done = min(max(upto - base, 0), len(msgs))
+
+        # Walk back from the newest message while turns and budget allow.
+        budget = self.budget(intent)
+        used = estimate_tokens(summary)
+        split = len(msgs)
+        while split > done and len(msgs) - split < self.keep_turns * 2:
+            cost = estimate_tokens(str(msgs[split - 1].content))
+            if used + cost > budget:
+                break
+            used += cost
+            split -= 1
+
+        # Aged-out turns are sent verbatim until `every` of them pile up or
+        # they no longer fit; trimmed messages are summarized right away.
+        pending = msgs[done:split]
+        if pending and (done < len(trimmed) or len(pending) >= self.every * 2
+                        or used + sum(estimate_tokens(str(m.content)) for m in pending) > budget):
+            summary = self.summarize(summary, pending)
+            self.summary_calls += 1
+            self.summaries.set(history.cid, (base + split, summary))
+            if trimmed:
+                history.trimmed = history.trimmed[min(split, len(trimmed)):]
+            done = split
+
+        out = []
+        if summary:
+            out.append({"role": "system", "content": "Summary of the earlier conversation:\n" + summary})
+        return out + list(msgs[done:])
+
+    def stats(self):
+        return {"summaries": len(self.summaries), "summary_calls": self.summary_calls}
@@ -0,0 +1,25 @@
+import gzip
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+'''
+ Response compression for JSON bodies. Brotli is used when the client
+ accepts it and the optional `brotli` package is installed, gzip otherwise.
+ '''
+MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+
+
+def compress(body: bytes, accept_encoding: str):
+    """Return (body, content_encoding); encoding is None when left as is."""
+    if len(body) < MIN_SIZE:
+        return body, None
+    accepted = {e.split(";")[0].strip().lower() for e in (accept_encoding or "").split(",")}
+    if brotli is not None and "br" in accepted:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in accepted:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
@@ -0,0 +1,66 @@
+import os
+import threading
+
+import numpy as np
+
+from utils.clients import embeddings
+
+'''
+ Optional embedding support for similarity lookups. Everything here is a
+ no-op unless AZURE_OPENAI_EMBEDDING_DEPLOYMENT is configured.
+ '''
+
+
+def get_embedder():
+    """Return a callable text -> np.ndarray, or None when not configured."""
+    if not os.getenv("AZURE_OPENAI_EMBEDDING_DEPLOYMENT"):
+        return None
+    client = embeddings.get()
+    return lambda text: np.asarray(client.embed_query(text), dtype=np.float32)
+
+
+class VectorIndex:
+    """Brute-force cosine index; fine for the few thousand entries we cache."""
+
+    def __init__(self):
+        self.keys = []
+        self._vectors = []
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def add(self, key, vector):
+        """Add `key`, replacing its vector if it is already indexed."""
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        vector = vector / norm if norm else vector
+        with self._lock:
+            if key in self.keys:
+                self._vectors[self.keys.index(key)] = vector
+            else:
+                self.keys.append(key)
+                self._vectors.append(vector)
+            self._matrix = None
+
+    def remove(self, key):
+        with self._lock:
+            if key in self.keys:
+                i = self.keys.index(key)
+                del self.keys[i]
+                del self._vectors[i]
+                self._matrix = None
+
+    def search(self, vector, threshold):
+        """Return (key, score) of the nearest entry at or above threshold."""
+        with self._lock:
+            if not self.keys:
+                return None, 0.0
+            if self._matrix is None:
+                self._matrix = np.vstack(self._vectors)
+            vector = np.asarray(vector, dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            scores = self._matrix @ (vector / norm if norm else vector)
+            i = int(np.argmax(scores))
+            score = float(scores[i])
+            if score < threshold:
+                return None, score
+            return self.keys[i], score
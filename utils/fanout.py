@@ -0,0 +1,171 @@
+import asyncio
+import contextvars
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, NamedTuple, Optional
+
+'''
+ Speculative fan-out over interchangeable sources. Sources are listed in
+ order of preference; each is started after its `delay` (hedging: a later
+ source only starts if nothing better has answered by then) and abandoned
+ after its `deadline`. A source that returns None or raises has "nothing".
+
+ The first source's answer wins outright. A later source's answer is
+ returned once every source ahead of it has settled, or once
+ `prefer_within` seconds have passed, so a fast fallback never waits on a
+ slow preferred source for longer than that. Losers are cancelled: asyncio
+ tasks for real, pool futures only if they have not started yet.
+ '''
+
+
+class Source(NamedTuple):
+    name: str
+    func: Callable[[], Any]
+    afunc: Optional[Callable[[], Any]] = None
+    delay: float = 0.0
+    deadline: float = 0.0
+
+
+class _Race:
+    def __init__(self, sources, prefer_within, stats):
+        self.sources = sources
+        self.prefer_within = prefer_within
+        self.stats = stats
+        self.start = time.monotonic()
+        self.running = {}
+        self.settled = set()
+        self.results = {}
+
+    def elapsed(self):
+        return time.monotonic() - self.start
+
+    def due(self, now):
+        """Indexes of sources that should be started now."""
+        if self.results:
+            return []
+        return [
+            i for i, s in enumerate(self.sources)
+            if i not in self.running and i not in self.settled
+            and (now >= s.delay or all(j in self.settled for j in range(i)))
+        ]
+
+    def finish(self, i, result=None, error=None):
+        del self.running[i]
+        if error is not None:
+            print(f"{self.sources[i].name} source error: {error}")
+            self.stats["errors:" + self.sources[i].name] += 1
+        if result is None:
+            self.settled.add(i)
+        else:
+            self.results[i] = result
+
+    def expired(self, now):
+        """Running sources past their deadline; they are treated as empty."""
+        late = [i for i in self.running if self.sources[i].deadline and now >= self.sources[i].deadline]
+        for i in late:
+            self.stats["timeouts:" + self.sources[i].name] += 1
+        return late
+
+    def winner(self, now):
+        if not self.results:
+            return None
+        i = min(self.results)
+        if now >= self.prefer_within or all(j in self.settled for j in range(i)):
+            return i
+        return None
+
+    def exhausted(self):
+        return len(self.settled) == len(self.sources)
+
+    def timeout(self, now):
+        """Seconds until the next deadline, hedge start or preference cut-off."""
+        events = [s.deadline for i, s in enumerate(self.sources) if i in self.running and s.deadline]
+        events += [s.delay for i, s in enumerate(self.sources)
+                   if i not in self.running and i not in self.settled and not self.results]
+        if self.results:
+            events.append(self.prefer_within)
+        events = [t - now for t in events if t > now]
+        return min(events) if events else None
+
+    def done(self, i):
+        name = self.sources[i].name if i is not None else "none"
+        self.stats["wins:" + name] += 1
+        return (name, self.results[i]) if i is not None else (None, None)
+
+
+class FanOut:
+    def __init__(self, max_workers=16):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+        self.counts = Counter()
+
+    def run(self, sources, prefer_within=0.0):
+        """Return (source name, result) of the winning source, or (None, None)."""
+        race = _Race(sources, prefer_within, self.counts)
+        futures = {}
+        while True:
+            now = race.elapsed()
+            for i in list(race.running):
+                if futures[i].done():
+                    try:
+                        race.finish(i, futures[i].result())
+                    except Exception as e:
+                        race.finish(i, error=e)
+            for i in race.expired(now):
+                futures[i].cancel()
+                race.finish(i)
+
+            winner = race.winner(now)
+            if winner is not None or race.exhausted():
+                for i in race.running:
+                    futures[i].cancel()
+                return race.done(winner)
+
+            for i in race.due(now):
+                race.running[i] = None
+                # Carry the request's context (its trace) into the pool thread.
+                futures[i] = self.executor.submit(contextvars.copy_context().run, sources[i].func)
+            pending = [futures[i] for i in race.running]
+            timeout = race.timeout(now)
+            if pending:
+                wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            elif timeout is not None:
+                time.sleep(timeout)
+
+    async def arun(self, sources, prefer_within=0.0):
+        race = _Race(sources, prefer_within, self.counts)
+        tasks = {}
+        try:
+            while True:
+                now = race.elapsed()
+                for i in list(race.running):
+                    if tasks[i].done():
+                        try:
+                            race.finish(i, tasks[i].result())
+                        except Exception as e:
+                            race.finish(i, error=e)
+                for i in race.expired(now):
+                    tasks[i].cancel()
+                    race.finish(i)
+
+                winner = race.winner(now)
+                if winner is not None or race.exhausted():
+                    return race.done(winner)
+
+                for i in race.due(now):
+                    s = sources[i]
+                    race.running[i] = None
+                    tasks[i] = asyncio.ensure_future(s.afunc() if s.afunc else asyncio.to_thread(s.func))
+                pending = [tasks[i] for i in race.running]
+                timeout = race.timeout(now)
+                if pending:
+                    await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                elif timeout is not None:
+                    await asyncio.sleep(timeout)
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        return dict(self.counts)
@@ -0,0 +1,36 @@
+import datetime
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+ JSON encoding for response payloads: orjson when installed, the stdlib
+ otherwise. Both handle numpy scalars and datetimes coming out of pandas.
+ '''
+
+
+def _default(o):
+    if hasattr(o, "item"):
+        return o.item()
+    if isinstance(o, (datetime.date, datetime.datetime)):
+        return o.isoformat()
+    return str(o)
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+def dumps_text(obj) -> str:
+    return dumps(obj).decode("utf-8")
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,38 @@
+import asyncio
+import os
+
+from langchain.agents.middleware import AgentMiddleware
+
+'''
+ Per-backend concurrency limits for the async serving path, so a burst of
+ requests can't open more LLM, SQL or search calls than the backend tolerates.
+ '''
+LIMITS = {
+    "llm": int(os.getenv("LLM_CONCURRENCY", "16")),
+    "sql": int(os.getenv("SQL_CONCURRENCY", "8")),
+    "search": int(os.getenv("SEARCH_CONCURRENCY", "16")),
+}
+
+_semaphores = {}
+
+
+def limit(backend: str) -> asyncio.Semaphore:
+    # Semaphores are created lazily so they bind to the running event loop.
+    sem = _semaphores.get(backend)
+    if sem is None:
+        sem = _semaphores[backend] = asyncio.Semaphore(LIMITS[backend])
+    return sem
+
+
+async def run_limited(backend: str, func, *args):
+    """Run a blocking call in a worker thread under the backend's limit."""
+    async with limit(backend):
+        return await asyncio.to_thread(func, *args)
+
+
+class LLMLimitMiddleware(AgentMiddleware):
+    """Holds an "llm" slot around each model call an agent makes."""
+
+    async def awrap_model_call(self, request, handler):
+        async with limit("llm"):
+            return await handler(request)
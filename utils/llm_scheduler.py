@@ -0,0 +1,427 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+from utils.clean_text import estimate_tokens
+from utils.metrics import LLM_RETRIES
+from utils.ratelimit import TokenBucket
+from utils.tracing import record
+
+'''
+ Rate-limit-aware scheduling for every Azure OpenAI call. The shared HTTP
+ clients in utils/clients.py send through LLMTransport, so chat, tool and
+ embedding calls from any module are covered without touching LangChain.
+
+ Per deployment (taken from the request URL):
+ - admission: each call reserves one request and its estimated tokens
+   (prompt + max_tokens) from RPM/TPM token buckets. Waiting callers pass
+   one at a time, interactive before batch, then FIFO;
+ - retries: 429 and 5xx responses and connection errors are retried with
+   jittered exponential backoff. A Retry-After (or retry-after-ms) header
+   is honoured and pauses admission for the whole deployment;
+ - circuit breaker: after LLM_BREAKER_FAILURES consecutive 5xx/connection
+   failures, calls fail fast for LLM_BREAKER_RESET seconds, then a single
+   trial call decides whether it closes again.
+ The OpenAI SDK's own retries are disabled, so they don't stack with these.
+ '''
+INTERACTIVE = 0
+BATCH = 1
+
+RPM = float(os.getenv("LLM_RPM", "0"))
+TPM = float(os.getenv("LLM_TPM", "0"))
+RATE_WINDOW = float(os.getenv("LLM_RATE_WINDOW", "1"))
+COMPLETION_TOKENS = int(os.getenv("LLM_COMPLETION_TOKENS", "500"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+RETRY_BASE = float(os.getenv("LLM_RETRY_BASE_MS", "500")) / 1000
+RETRY_MAX = float(os.getenv("LLM_RETRY_MAX_MS", "20000")) / 1000
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+DEPLOYMENT_RE = re.compile(r"/deployments/([^/]+)/")
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def set_priority(level):
+    """Set the admission priority of LLM calls made from the current context."""
+    _priority.set(level)
+
+
+def parse_quotas(value: str) -> dict:
+    # "gpt-4o=300:50000,embed=1000:200000" -> {"gpt-4o": (300.0, 50000.0), ...}
+    quotas = {}
+    for item in value.split(","):
+        if "=" in item and ":" in item:
+            name, limits = item.split("=", 1)
+            rpm, tpm = limits.split(":", 1)
+            quotas[name.strip()] = (float(rpm), float(tpm))
+    return quotas
+
+
+QUOTAS = parse_quotas(os.getenv("LLM_QUOTAS", ""))
+
+
+def estimate_request_tokens(body: bytes) -> int:
+    """Prompt tokens plus the completion allowance, as Azure counts them for TPM."""
+    try:
+        data = json.loads(body or b"{}")
+    except ValueError:
+        return estimate_tokens(body.decode("utf-8", "ignore")) if body else 1
+    if not isinstance(data, dict):
+        return 1
+    parts = []
+    for message in data.get("messages") or []:
+        content = message.get("content") if isinstance(message, dict) else None
+        if isinstance(content, list):
+            parts.extend(p.get("text", "") for p in content if isinstance(p, dict))
+        elif content:
+            parts.append(str(content))
+    if data.get("tools"):
+        parts.append(json.dumps(data["tools"]))
+    inputs = data.get("input")
+    if isinstance(inputs, str):
+        parts.append(inputs)
+    elif isinstance(inputs, list):
+        parts.extend(str(i) for i in inputs)
+    completion = data.get("max_completion_tokens") or data.get("max_tokens")
+    if completion is None:
+        completion = COMPLETION_TOKENS if "messages" in data else 0
+    return estimate_tokens("\n".join(parts)) + completion
+
+
+def retry_after(response) -> float:
+    """Seconds the server asked us to wait, or 0."""
+    value = response.headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = response.headers.get("retry-after")
+    if not value:
+        return 0.0
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return 0.0
+
+
+class CircuitOpenError(httpx.TransportError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.consecutive = 0
+        self.opened_at = None
+        self.trial = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        """Raise if open; return True if this call is the half-open trial."""
+        if not self.failures:
+            return False
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return False
+            if state == "half_open" and not self.trial:
+                self.trial = True
+                return True
+            self.rejected += 1
+        raise CircuitOpenError("LLM circuit breaker is open; the deployment is failing")
+
+    def success(self):
+        with self._lock:
+            self.consecutive = 0
+            self.opened_at = None
+            self.trial = False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.trial or (self.failures and self.consecutive >= self.failures):
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.consecutive, "rejected": self.rejected}
+
+
+class _Waiter:
+    """A queued caller; `wake` hands it the admission turn."""
+
+    def __init__(self, priority, seq, wake):
+        self.priority = priority
+        self.seq = seq
+        self.wake = wake
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class DeploymentScheduler:
+    def __init__(self, name, rpm, tpm, window=RATE_WINDOW):
+        self.name = name
+        # Azure enforces quotas over 1-10s windows, so the burst is one window's worth.
+        self.requests = TokenBucket(rpm / 60, burst=max(rpm / 60 * window, 1))
+        self.tokens = TokenBucket(tpm / 60, burst=max(tpm / 60 * window, 1))
+        self.breaker = CircuitBreaker()
+        self.paused_until = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.waited = 0.0
+        self.throttled = 0
+        self.retries = 0
+        self._busy = False
+        self._queue = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    # --- admission turn: one caller at a time, highest priority first ---
+
+    def _enter(self, wake):
+        with self._lock:
+            if not self._busy:
+                self._busy = True
+                return True
+            self.queued += 1
+            heapq.heappush(self._queue, _Waiter(_priority.get(), next(self._seq), wake))
+            return False
+
+    def _leave(self):
+        with self._lock:
+            if not self._queue:
+                self._busy = False
+                return
+            waiter = heapq.heappop(self._queue)
+        waiter.wake()
+
+    def _reserve(self, cost):
+        with self._lock:
+            self.admitted += 1
+            pause = self.paused_until - time.monotonic()
+        return max(self.requests.reserve(1), self.tokens.reserve(cost), pause, 0.0)
+
+    def admit(self, cost):
+        start = time.perf_counter()
+        turn = threading.Event()
+        if not self._enter(turn.set):
+            turn.wait()
+        try:
+            delay = self._reserve(cost)
+            if delay:
+                time.sleep(delay)
+        finally:
+            self._leave()
+        self._waited(time.perf_counter() - start)
+
+    async def aadmit(self, cost):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        turn = loop.create_future()
+
+        def resolve():
+            # A caller cancelled while queued passes its turn straight on.
+            if turn.cancelled():
+                self._leave()
+            else:
+                turn.set_result(None)
+
+        if not self._enter(lambda: loop.call_soon_threadsafe(resolve)):
+            try:
+                await turn
+            except BaseException:
+                # Cancelled after the turn was granted: hand it on, or every
+                # later call to this deployment would wait forever.
+                if turn.done() and not turn.cancelled():
+                    self._leave()
+                raise
+        try:
+            delay = self._reserve(cost)
+            if delay:
+                await asyncio.sleep(delay)
+        finally:
+            self._leave()
+        self._waited(time.perf_counter() - start)
+
+    def _waited(self, seconds):
+        with self._lock:
+            self.waited += seconds
+        record("llm_queue", "scheduler", seconds)
+
+    # --- outcomes ---
+
+    def backoff(self, attempt, response=None):
+        """Seconds to wait before retry `attempt` (1-based)."""
+        delay = random.uniform(0, min(RETRY_MAX, RETRY_BASE * 2 ** (attempt - 1)))
+        server = retry_after(response) if response is not None else 0.0
+        with self._lock:
+            self.retries += 1
+            if server:
+                delay = server + random.uniform(0, RETRY_BASE)
+                if response.status_code == 429:
+                    # The quota is shared: hold everyone back, not just this caller.
+                    self.paused_until = max(self.paused_until, time.monotonic() + server)
+        return delay
+
+    def outcome(self, response=None, error=None):
+        """Record one attempt; return True if it should be retried."""
+        if error is not None:
+            self.breaker.failure()
+            reason = "connection"
+        elif response.status_code == 429:
+            # Throttling means "slow down", not "broken": the deployment answered.
+            self.breaker.success()
+            with self._lock:
+                self.throttled += 1
+            reason = "throttled"
+        elif response.status_code in RETRY_STATUSES:
+            self.breaker.failure()
+            reason = "server_error"
+        else:
+            self.breaker.success()
+            return False
+        LLM_RETRIES.inc(deployment=self.name, reason=reason)
+        return True
+
+    def stats(self):
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "queue_wait_seconds": round(self.waited, 3),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "rpm_waits": self.requests.stats()["waits"],
+            "tpm_waits": self.tokens.stats()["waits"],
+            "breaker": self.breaker.stats(),
+        }
+
+
+class LLMScheduler:
+    def __init__(self, rpm=RPM, tpm=TPM, quotas=None, max_retries=MAX_RETRIES):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.quotas = quotas or {}
+        self.max_retries = max_retries
+        self._deployments = {}
+        self._lock = threading.Lock()
+
+    def deployment(self, request) -> DeploymentScheduler:
+        match = DEPLOYMENT_RE.search(request.url.path)
+        name = match.group(1) if match else request.url.host
+        scheduler = self._deployments.get(name)
+        if scheduler is None:
+            with self._lock:
+                scheduler = self._deployments.get(name)
+                if scheduler is None:
+                    rpm, tpm = self.quotas.get(name, (self.rpm, self.tpm))
+                    scheduler = self._deployments[name] = DeploymentScheduler(name, rpm, tpm)
+        return scheduler
+
+    def send(self, request, send):
+        scheduler = self.deployment(request)
+        cost = estimate_request_tokens(request.content)
+        attempt = 0
+        while True:
+            trial = scheduler.breaker.allow()
+            response, error = None, None
+            try:
+                scheduler.admit(cost)
+                response = send(request)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                # A cancelled trial call must not leave the breaker half-open forever.
+                if trial:
+                    scheduler.breaker.failure()
+                raise
+            attempt += 1
+            if not scheduler.outcome(response, error) or attempt > self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            delay = scheduler.backoff(attempt, response)
+            if response is not None:
+                response.close()
+            time.sleep(delay)
+
+    async def asend(self, request, send):
+        scheduler = self.deployment(request)
+        cost = estimate_request_tokens(request.content)
+        attempt = 0
+        while True:
+            trial = scheduler.breaker.allow()
+            response, error = None, None
+            try:
+                await scheduler.aadmit(cost)
+                response = await send(request)
+            except httpx.TransportError as e:
+                error = e
+            except BaseException:
+                # A cancelled trial call must not leave the breaker half-open forever.
+                if trial:
+                    scheduler.breaker.failure()
+                raise
+            attempt += 1
+            if not scheduler.outcome(response, error) or attempt > self.max_retries:
+                if error is not None:
+                    raise error
+                return response
+            delay = scheduler.backoff(attempt, response)
+            if response is not None:
+                await response.aclose()
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {name: s.stats() for name, s in self._deployments.items()}
+
+
+class LLMTransport(httpx.BaseTransport):
+    def __init__(self, scheduler, transport):
+        self.scheduler = scheduler
+        self.transport = transport
+
+    def handle_request(self, request):
+        return self.scheduler.send(request, self.transport.handle_request)
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncLLMTransport(httpx.AsyncBaseTransport):
+    def __init__(self, scheduler, transport):
+        self.scheduler = scheduler
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        return await self.scheduler.asend(request, self.transport.handle_async_request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+llm_scheduler = LLMScheduler(quotas=QUOTAS)
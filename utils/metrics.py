@@ -0,0 +1,100 @@
+import math
+import threading
+
+'''
+ Minimal Prometheus metrics (counters and histograms) rendered in the text
+ exposition format for GET /metrics, so no client library is needed.
+ '''
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets) + (math.inf,)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    le = "+Inf" if bound == math.inf else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), key + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+                lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "ask_request_duration_seconds", "End-to-end request latency.", ("endpoint", "intent")
+)
+STAGE_SECONDS = Histogram(
+    "ask_stage_duration_seconds", "Latency of one pipeline stage.", ("stage", "backend", "intent")
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total", "LLM tokens by direction (prompt/completion).", ("deployment", "direction")
+)
+LLM_CALLS = Counter("llm_calls_total", "LLM calls by outcome.", ("deployment", "outcome"))
+LLM_RETRIES = Counter(
+    "llm_retries_total", "LLM HTTP attempts retried, by reason.", ("deployment", "reason")
+)
+PAYLOAD_BYTES = Histogram(
+    "ask_payload_bytes", "Size of payloads passed between stages.", ("kind", "intent"), buckets=SIZE_BUCKETS
+)
+
+REGISTRY = [REQUEST_SECONDS, STAGE_SECONDS, LLM_TOKENS, LLM_CALLS, LLM_RETRIES, PAYLOAD_BYTES]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
@@ -0,0 +1,78 @@
+import re
+
+from utils.fastjson import dumps_text, loads
+
+CITATIONS_RE = re.compile(r"\[CITATIONS_METADATA\](.*?)\[/CITATIONS_METADATA\]", re.DOTALL)
+
+# "records": table rows as a list of {column: value} dicts (the original shape).
+# "compact": {"columns": [...], "rows": [[...], ...]}, column names sent once.
+TABLE_FORMATS = ("records", "compact")
+
+
+def build_payload(answer, table_format="records"):
+    """Turn the final agent answer into the JSON body sent to the client.
+
+    `answer` is the agent's text, or the tool's dict when it ran directly.
+    Returns (payload, is_text); only text answers are written to memory.
+    """
+    # ---- GRAPH / TABLE PASS-THROUGH ----
+    if isinstance(answer, dict):
+        parsed = answer
+    else:
+        try:
+            parsed = loads(answer)
+        except Exception:
+            parsed = None
+    if not isinstance(parsed, dict):
+        parsed = None
+
+    if parsed and parsed.get("type") == "image":
+        return {
+            "type": "image",
+            "image": parsed["data"],
+            "answer": "Here is the graph."
+        }, False
+
+    if parsed and parsed.get("type") == "chart":
+        return {
+            "type": "chart",
+            "chart": parsed["data"],
+            "answer": "Here is the graph."
+        }, False
+
+    if parsed and parsed.get("type") == "sql_result":
+        columns, rows = parsed.get("columns", []), parsed.get("rows", [])
+        if table_format == "compact":
+            payload = {"type": "table", "columns": columns, "rows": rows}
+        else:
+            payload = {"type": "table", "data": [dict(zip(columns, row)) for row in rows]}
+        for key in ("offset", "total", "truncated", "next"):
+            if key in parsed:
+                payload[key] = parsed[key]
+        return payload, False
+
+    if not isinstance(answer, str):
+        answer = dumps_text(answer)
+
+    payload = {"answer": answer}
+    match = CITATIONS_RE.search(answer)
+    if match:
+        try:
+            payload["citations"] = loads(match.group(1))
+            payload["answer"] = CITATIONS_RE.sub("", answer).strip()
+        except Exception:
+            pass
+    return payload, True
+
+
+def table_format_of(data):
+    fmt = (data or {}).get("format", "records")
+    return fmt if fmt in TABLE_FORMATS else "records"
+
+
+def build_messages(history, query):
+    return list(history) + [{"role": "user", "content": query}]
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {dumps_text(data)}\n\n"
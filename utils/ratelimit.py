@@ -0,0 +1,51 @@
+import asyncio
+import threading
+import time
+
+'''
+ Token-bucket rate limiting shared by every thread of the process. A caller
+ reserves tokens up front and is told how long to wait before using them,
+ so waiting callers are served in arrival order instead of racing on wake-up.
+ '''
+
+
+class TokenBucket:
+    def __init__(self, rate, burst=None):
+        """`rate` tokens per second (0 = unlimited), holding at most `burst`."""
+        self.rate = rate
+        self.capacity = burst or max(rate, 1)
+        self.tokens = self.capacity
+        self.waits = 0
+        self.waited = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, tokens=1):
+        """Take `tokens` and return how many seconds to wait before using them."""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= tokens
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            if delay:
+                self.waits += 1
+                self.waited += delay
+            return delay
+
+    def acquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            time.sleep(delay)
+
+    async def aacquire(self, tokens=1):
+        delay = self.reserve(tokens)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {"rate": self.rate, "waits": self.waits, "waited_seconds": round(self.waited, 3)}
@@ -0,0 +1,104 @@
+import asyncio
+import functools
+import threading
+
+from utils.clean_text import normalize_query
+
+'''
+ Request coalescing ("single flight"): while a call for a given key is in
+ progress, identical calls wait for it and share its result (or its
+ exception) instead of hitting the LLM, SQL Server or the search backend
+ again. Threaded callers coalesce with each other, and so do coroutines
+ on the same event loop.
+ '''
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        with self._lock:
+            self.calls += 1
+            call = self._flights.get(key)
+            leader = call is None
+            if leader:
+                call = self._flights[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            call.done.set()
+
+    async def ado(self, key, afunc, *args):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get((loop, key))
+            if task is None:
+                task = self._tasks[(loop, key)] = asyncio.ensure_future(afunc(*args))
+                task.add_done_callback(lambda _: self._forget(loop, key, task))
+            else:
+                self.coalesced += 1
+        # shield: one caller going away must not cancel the shared call.
+        return await asyncio.shield(task)
+
+    def _forget(self, loop, key, task):
+        with self._lock:
+            if self._tasks.get((loop, key)) is task:
+                del self._tasks[(loop, key)]
+
+    def stats(self):
+        return {"calls": self.calls, "coalesced": self.coalesced, "in_flight": len(self._flights) + len(self._tasks)}
+
+
+flights = {}
+
+
+def coalesce(name):
+    """Decorate a function of one question string (sync or async) to coalesce duplicates."""
+    flight = flights.setdefault(name, SingleFlight(name))
+
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(question):
+                return await flight.ado(normalize_query(question), func, question)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(question):
+            return flight.do(normalize_query(question), func, question)
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    return {name: flight.stats() for name, flight in flights.items()}
@@ -0,0 +1,42 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+'''
+ Signed, stateless continuation tokens. The payload travels with the client,
+ so any worker can serve the next page, and the signature stops a client
+ from editing it (page tokens carry the SQL to re-read).
+ Set TOKEN_SECRET to the same value on every worker.
+ '''
+SECRET = (os.getenv("TOKEN_SECRET") or secrets.token_hex(32)).encode("utf-8")
+TOKEN_TTL = float(os.getenv("TOKEN_TTL", "3600"))
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def sign_token(payload: dict) -> str:
+    body = _b64(json.dumps({**payload, "iat": time.time()}, separators=(",", ":")).encode("utf-8"))
+    sig = _b64(hmac.new(SECRET, body.encode("ascii"), hashlib.sha256).digest())
+    return f"{body}.{sig}"
+
+
+def read_token(token: str) -> dict:
+    body, _, sig = str(token).partition(".")
+    expected = _b64(hmac.new(SECRET, body.encode("utf-8"), hashlib.sha256).digest())
+    if not hmac.compare_digest(sig.encode("utf-8"), expected.encode("ascii")):
+        raise ValueError("bad signature")
+    # Signed by us, so the body is well-formed.
+    payload = json.loads(_unb64(body))
+    if payload["iat"] + TOKEN_TTL < time.time():
+        raise ValueError("token expired")
+    return payload
@@ -0,0 +1,153 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.metrics import LLM_CALLS, LLM_TOKENS, PAYLOAD_BYTES, REQUEST_SECONDS, STAGE_SECONDS
+
+'''
+ Per-request tracing. A Trace lives in a context variable for the duration
+ of a request; span() times one stage, feeds the stage histogram (labelled
+ with the request's intent) and records the stage on the trace, which can
+ be returned as a Server-Timing header. LLM calls are timed and their token
+ usage counted by a LangChain callback attached to every shared client.
+
+ Context variables follow asyncio tasks and asyncio.to_thread; pool
+ threads started with copy_context().run (see utils/fanout.py) join the
+ submitting request's trace as well.
+ '''
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+class Trace:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.intent = ""
+        self.spans = []
+        self.tokens_in = 0
+        self.tokens_out = 0
+        # Tools that failed or came back empty during this request.
+        self.failed_tools = []
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def server_timing(self) -> str:
+        # Repeated stages (several LLM hops) are summed into one entry.
+        totals = {}
+        for stage, seconds in self.spans:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()]
+        if self.tokens_in or self.tokens_out:
+            parts.append(f'tokens;desc="in={self.tokens_in} out={self.tokens_out}"')
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def start_trace() -> Trace:
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def set_intent(intent):
+    trace = _trace.get()
+    if trace is not None:
+        trace.intent = intent
+
+
+def current_intent():
+    trace = _trace.get()
+    return trace.intent if trace is not None else ""
+
+
+def tool_failed(name):
+    trace = _trace.get()
+    if trace is not None:
+        trace.failed_tools.append(name)
+
+
+def failed_tools():
+    trace = _trace.get()
+    return list(trace.failed_tools) if trace is not None else []
+
+
+def record(stage, backend, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage, backend=backend, intent=current_intent())
+    trace = _trace.get()
+    if trace is not None:
+        trace.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage, backend="app"):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, backend, time.perf_counter() - start)
+
+
+def observe_payload(kind, size):
+    PAYLOAD_BYTES.observe(size, kind=kind, intent=current_intent())
+
+
+def observe_request(endpoint, trace):
+    REQUEST_SECONDS.observe(trace.elapsed(), endpoint=endpoint, intent=trace.intent)
+
+
+def wants_timing(headers) -> bool:
+    return TIMING_HEADER or headers.get("X-Timing") == "1"
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Times each LLM call and counts its prompt/completion tokens."""
+
+    # Run in the caller's context (not an executor) so spans reach its trace.
+    run_inline = True
+
+    def __init__(self, deployment):
+        self.deployment = deployment
+        self._started = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            record("llm", "azure_openai", time.perf_counter() - start)
+        LLM_CALLS.inc(deployment=self.deployment, outcome="ok")
+
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if not usage:
+            for generations in response.generations:
+                for g in generations:
+                    meta = getattr(getattr(g, "message", None), "usage_metadata", None) or {}
+                    usage = {"prompt_tokens": meta.get("input_tokens", 0),
+                             "completion_tokens": meta.get("output_tokens", 0)}
+        tokens_in = usage.get("prompt_tokens") or 0
+        tokens_out = usage.get("completion_tokens") or 0
+        LLM_TOKENS.inc(tokens_in, deployment=self.deployment, direction="prompt")
+        LLM_TOKENS.inc(tokens_out, deployment=self.deployment, direction="completion")
+        trace = _trace.get()
+        if trace is not None:
+            trace.tokens_in += tokens_in
+            trace.tokens_out += tokens_out
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            record("llm", "azure_openai", time.perf_counter() - start)
+        LLM_CALLS.inc(deployment=self.deployment, outcome="error")
@@ -0,0 +1,22 @@
+from utils.clients import get_llm
+from tools import policy_tool, sql_tool
+
+# Backends are built lazily on first use; /warmup lets a deploy pay that cost
+# (and surface misconfiguration) before real traffic arrives.
+WARMUPS = {
+    "llm": get_llm,
+    "sql": sql_tool.warmup,
+    "policy": policy_tool.warmup,
+    "policy_index": policy_tool.sync_index,
+}
+
+
+def warmup_backends():
+    status = {}
+    for name, func in WARMUPS.items():
+        try:
+            func()
+            status[name] = "ok"
+        except Exception as e:
+            status[name] = f"error: {e}"
+    return status